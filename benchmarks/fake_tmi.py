@@ -0,0 +1,166 @@
+"""
+    Minimal stand in for irc.chat.twitch.tv to benchmark the bot offline.
+    Supports capability negotiation, JOIN/PART echoes, PING/PONG both ways, PRIVMSG fan-out with tags to every other
+    connection in the channel and twitch's msg_ratelimit NOTICE when a user sends faster than the message limit.
+
+    usage (from the repository root): python -m benchmarks.fake_tmi [port]
+    and point TwitchChat at it with server="127.0.0.1:(port)"
+"""
+import asyncio
+import itertools
+import logging
+import sys
+import time
+from collections import deque
+
+HOST = "tmi.twitch.tv"
+
+
+class FakeConnection:
+    def __init__(self, server: 'FakeTmi', reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.nick = None
+        self.caps = set()
+        self.channels = set()
+        self.sent = deque()
+
+    @property
+    def prefix(self):
+        return "{0}!{0}@{0}.{1}".format(self.nick, HOST)
+
+    def write(self, line: str):
+        self.writer.write((line + "\r\n").encode("utf-8"))
+
+    def rate_limited(self) -> bool:
+        now = time.monotonic()
+        while len(self.sent) != 0 and self.sent[0] <= now - self.server.send_period:
+            self.sent.popleft()
+        if len(self.sent) >= self.server.send_rate:
+            return True
+        self.sent.append(now)
+        return False
+
+
+class FakeTmi:
+    def __init__(self, host="127.0.0.1", port=6667, ping_interval=60, send_rate=20, send_period=30):
+        self.logger = logging.getLogger(name="fake_tmi")
+        self.host = host
+        self.port = port
+        self.ping_interval = ping_interval
+        self.send_rate = send_rate
+        self.send_period = send_period
+        self.channels = {}
+        self.connections = set()
+        self.rate_limit_notices = 0
+        self._ids = itertools.count()
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+
+    async def stop(self):
+        self._server.close()
+        for conn in list(self.connections):
+            conn.writer.close()
+        await self._server.wait_closed()
+
+    def members(self, channel) -> set:
+        return self.channels.get(channel, set())
+
+    async def handle_connection(self, reader, writer):
+        conn = FakeConnection(self, reader, writer)
+        self.connections.add(conn)
+        pinger = asyncio.get_running_loop().create_task(self.ping_loop(conn))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.handle_line(conn, line.decode("utf-8").rstrip("\r\n"))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            pinger.cancel()
+            self.connections.discard(conn)
+            for channel in conn.channels:
+                self.members(channel).discard(conn)
+            writer.close()
+
+    async def ping_loop(self, conn: FakeConnection):
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            conn.write("PING :" + HOST)
+
+    def handle_line(self, conn: FakeConnection, line: str):
+        command, _, rest = line.partition(" ")
+        command = command.upper()
+        if command == "NICK":
+            conn.nick = rest.strip().lower()
+            for code, text in [("001", "Welcome, GLHF!"), ("002", "Your host is " + HOST),
+                               ("375", "-"), ("376", ">")]:
+                conn.write(":{0} {1} {2} :{3}".format(HOST, code, conn.nick, text))
+        elif command == "CAP":
+            caps = rest.partition(":")[2]
+            conn.caps.update(caps.split())
+            conn.write(":{0} CAP * ACK :{1}".format(HOST, caps))
+        elif command == "PING":
+            conn.write(":{0} PONG {0} :{1}".format(HOST, rest.partition(":")[2]))
+        elif command == "JOIN":
+            for channel in rest.strip().split(","):
+                self.join(conn, channel.lstrip("#").lower())
+        elif command == "PART":
+            for channel in rest.strip().split(","):
+                self.part(conn, channel.lstrip("#").lower())
+        elif command == "PRIVMSG":
+            target, _, text = rest.partition(" :")
+            self.privmsg(conn, target.strip().lstrip("#").lower(), text)
+
+    def join(self, conn: FakeConnection, channel: str):
+        self.channels[channel] = self.members(channel)
+        self.channels[channel].add(conn)
+        conn.channels.add(channel)
+        for member in self.members(channel):
+            if member is conn or "twitch.tv/membership" in member.caps:
+                member.write(":{0} JOIN #{1}".format(conn.prefix, channel))
+        conn.write(":{0}.{1} 353 {0} = #{2} :{0}".format(conn.nick, HOST, channel))
+        conn.write(":{0}.{1} 366 {0} #{2} :End of /NAMES list".format(conn.nick, HOST, channel))
+
+    def part(self, conn: FakeConnection, channel: str):
+        if channel not in conn.channels:
+            return
+        for member in self.members(channel):
+            if member is conn or "twitch.tv/membership" in member.caps:
+                member.write(":{0} PART #{1}".format(conn.prefix, channel))
+        self.members(channel).discard(conn)
+        conn.channels.discard(channel)
+
+    def privmsg(self, conn: FakeConnection, channel: str, text: str):
+        if channel not in conn.channels:
+            return
+        if conn.rate_limited():
+            self.rate_limit_notices += 1
+            conn.write("@msg-id=msg_ratelimit :{0} NOTICE #{1} :Your message was not sent because you are sending "
+                       "messages too quickly.".format(HOST, channel))
+            return
+        tags = ("@badge-info=;badges=;color=#1E90FF;display-name={0};emotes=;flags=;id={1};mod=0;room-id=1;"
+                "subscriber=0;tmi-sent-ts={2};turbo=0;user-id=1;user-type= ").format(
+            conn.nick, next(self._ids), int(time.time() * 1000))
+        line = ":{0} PRIVMSG #{1} :{2}".format(conn.prefix, channel, text)
+        for member in self.members(channel):
+            if member is not conn:
+                member.write(tags + line if "twitch.tv/tags" in member.caps else line)
+
+
+async def serve(port):
+    server = FakeTmi(port=port)
+    await server.start()
+    print("Fake tmi listening on 127.0.0.1:{0}".format(port))
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.INFO)
+    asyncio.run(serve(int(sys.argv[1]) if len(sys.argv) > 1 else 6667))
@@ -0,0 +1,72 @@
+"""
+    Measures saving and loading of the utility.file_loader text format on synthetic state files.
+    The files look like global_state.txt (users with counters) and streaks.txt (channels with emote streaks),
+    every object is checked to come back identical after a save and load.
+
+    usage (from the repository root): python -m benchmarks.file_loader [size in MB] ...
+    sizes default to 1 10 100
+"""
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+from utility import file_loader as f
+
+
+def random_word(rng: random.Random) -> str:
+    return "".join(rng.choice(string.ascii_letters) for _ in range(rng.randint(3, 12)))
+
+
+def state_like(rng: random.Random, users: int) -> dict:
+    """global_state.txt: channel settings and users with their counters"""
+    state = {"channel{0}".format(i): {"lacking": str(rng.randint(0, 10000)), "toggle": "ON"} for i in range(10)}
+    for i in range(users):
+        counters = {random_word(rng): str(rng.randint(0, 5000)) for _ in range(rng.randint(0, 6))}
+        state["user{0}".format(i)] = {"counters": counters, "alts": [random_word(rng) for _ in range(2)]}
+    return state
+
+
+def streaks_like(rng: random.Random, emotes: int) -> dict:
+    """streaks.txt: emote streaks per channel"""
+    return {"channel{0}".format(i): {random_word(rng): {"current": str(rng.randint(0, 5)), "max": str(rng.randint(0, 80))}
+                                     for _ in range(emotes // 10)} for i in range(10)}
+
+
+def grow(make, size: int, rng: random.Random):
+    """Scales the amount of entries until the saved text is about size bytes"""
+    amount = 1000
+    obj = make(rng, amount)
+    length = len(f.to_pretty_txt(obj))
+    amount = max(1, int(amount * size / length))
+    return make(rng, amount)
+
+
+def bench(name: str, obj, fp: str):
+    start = time.perf_counter()
+    f.save(obj, fp)
+    saved = time.perf_counter() - start
+    size = os.path.getsize(fp)
+    start = time.perf_counter()
+    loaded = f.load(fp)
+    elapsed = time.perf_counter() - start
+    if loaded != obj:
+        print("{0}: loaded object differs from the saved one".format(name))
+    print("{0:<10}{1:>10.1f}{2:>12.3f}{3:>12.1f}{4:>12.3f}{5:>12.1f}".format(
+        name, size / 1e6, saved, size / 1e6 / saved, elapsed, size / 1e6 / elapsed))
+
+
+def main(sizes: list):
+    rng = random.Random(0)
+    print("{0:<10}{1:>10}{2:>12}{3:>12}{4:>12}{5:>12}".format("file", "MB", "save s", "save MB/s", "load s",
+                                                              "load MB/s"))
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            for name, make in [("state", state_like), ("streaks", streaks_like)]:
+                obj = grow(make, int(size * 1e6), rng)
+                bench(name, obj, os.path.join(directory, name + ".txt"))
+
+
+if __name__ == "__main__":
+    main([float(size) for size in sys.argv[1:]] or [1, 10, 100])
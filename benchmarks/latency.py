@@ -0,0 +1,105 @@
+"""
+    Measures the time between a chat message arriving and the bot's reply, fully offline.
+    Starts benchmarks.fake_tmi in process, connects a TwitchChat to it and lets a load generator send "!ping" as the
+    bot admin across many channels at a configurable rate. Every reply of the bot is matched to the oldest unanswered
+    ping of its channel.
+
+    usage (from the repository root): python -m benchmarks.latency [channels] [messages/sec] [seconds]
+"""
+import asyncio
+import logging
+import sys
+import time
+from collections import deque
+from twitchchat import TwitchChat
+from benchmarks.fake_tmi import FakeTmi
+from benchmarks.replay import OfflineStatus, scratch_files
+
+PORT = 16667
+BOT = "latencybot"
+LOADGEN = "loadgen"
+
+
+def percentile(values: list, pct: float) -> float:
+    if len(values) == 0:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+class LoadGenerator:
+    def __init__(self, channels: list, rate: float, duration: float):
+        self.channels = channels
+        self.rate = rate
+        self.duration = duration
+        self.waiting = {channel: deque() for channel in channels}
+        self.latencies = []
+        self.sent = 0
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection("127.0.0.1", PORT)
+        self.writer.write("NICK {0}\r\nCAP REQ :twitch.tv/tags\r\n".format(LOADGEN).encode("utf-8"))
+        self.writer.write("JOIN {0}\r\n".format(",".join("#" + chan for chan in self.channels)).encode("utf-8"))
+        await self.writer.drain()
+
+    async def read_replies(self):
+        prefix = ":{0}!".format(BOT)
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                return
+            line = line.decode("utf-8")
+            if line.startswith("@"):
+                line = line.partition(" ")[2]
+            if not line.startswith(prefix) or " PRIVMSG #" not in line:
+                continue
+            channel = line.partition(" PRIVMSG #")[2].partition(" ")[0]
+            if len(self.waiting.get(channel, [])) != 0:
+                self.latencies.append(time.monotonic() - self.waiting.get(channel).popleft())
+
+    async def send_load(self):
+        interval = 1 / self.rate
+        start = time.monotonic()
+        while time.monotonic() - start < self.duration:
+            channel = self.channels[self.sent % len(self.channels)]
+            self.writer.write("PRIVMSG #{0} :!ping\r\n".format(channel).encode("utf-8"))
+            await self.writer.drain()
+            self.waiting.get(channel).append(time.monotonic())
+            self.sent += 1
+            await asyncio.sleep(max(0.0, start + self.sent * interval - time.monotonic()))
+
+
+async def run(channel_count: int, rate: float, duration: float):
+    server = FakeTmi(port=PORT)
+    await server.start()
+    channels = ["benchmark{0}".format(i) for i in range(channel_count)]
+    bot = TwitchChat(BOT, [LOADGEN], "oauth:benchmark", list(channels), OfflineStatus(), interactive=False,
+                     server="127.0.0.1:{0}".format(PORT), **scratch_files())
+    # repeating tasks poll external apis, they aren't part of the benchmark
+    bot.repeating_tasks = {}
+    bot.start()
+    while sum(1 for chan in channels if any(conn.nick == BOT for conn in server.members(chan))) < channel_count:
+        await asyncio.sleep(0.1)
+    load = LoadGenerator(channels, rate, duration)
+    await load.connect()
+    reader = asyncio.get_running_loop().create_task(load.read_replies())
+    await load.send_load()
+    # give the bot time to work through what's still queued
+    await asyncio.sleep(5)
+    reader.cancel()
+    bot.stop_all()
+    await server.stop()
+
+    latencies = [latency * 1000 for latency in load.latencies]
+    print("Sent {0} pings over {1} channels at {2}/s, got {3} replies".format(load.sent, channel_count, rate,
+                                                                                len(latencies)))
+    print("Latency ms: p50 {0:.1f} p90 {1:.1f} p99 {2:.1f} max {3:.1f}".format(
+        percentile(latencies, 50), percentile(latencies, 90), percentile(latencies, 99),
+        max(latencies) if len(latencies) != 0 else float("nan")))
+    print("Unanswered: {0}, msg_ratelimit notices: {1}".format(load.sent - len(latencies), server.rate_limit_notices))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.WARNING)
+    args = sys.argv[1:] + [None] * 3
+    asyncio.run(run(int(args[0] or 10), float(args[1] or 0.5), float(args[2] or 30)))
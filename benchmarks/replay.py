@@ -0,0 +1,153 @@
+"""
+    Replays a capture made with the "record" console command through TwitchChat.handle_message as fast as possible.
+    Nothing is sent to twitch, the connections and worker pool of the bot are replaced by stubs so every line gets
+    handled synchronously and every outgoing line ends up in a sink.
+
+    usage (from the repository root): python -m benchmarks.replay captures/(capture).txt.gz
+"""
+import functools
+import os
+import sys
+import tempfile
+import time
+from twitchchat import TwitchChat
+from twitchchat.capture import read_capture
+from twitchchat.parser import parse
+from utility import ToggleType, Journal, JOURNAL_FUNCTIONS
+from credentials.credentials import *
+
+
+def scratch_files() -> dict:
+    """TwitchChat keyword arguments that keep the state and journal writes of a benchmark out of texts/"""
+    directory = tempfile.mkdtemp(prefix="benchmark")
+    return {"state_file": os.path.join(directory, "global_state.txt"),
+            "journal": Journal(os.path.join(directory, "journal.txt"), JOURNAL_FUNCTIONS)}
+
+
+class StubClient:
+    """Stands in for IrcClient, keeps every line instead of sending it"""
+
+    def __init__(self):
+        self.connected = True
+        self.sent = []
+
+    def send_message(self, msg: str, channel=None, priority=0, max_age=None):
+        self.sent.append((channel, priority, msg))
+
+
+class OutboundSink(StubClient):
+    """Stands in for the ConnectionPool of the bot"""
+
+    def __init__(self):
+        super().__init__()
+        self.recorder = None
+
+    def assign(self, channel):
+        return self
+
+    def release(self, channel):
+        return self
+
+    def rebalance(self):
+        return []
+
+    def channels_of(self, client):
+        return []
+
+
+class InlineWorkers:
+    """Stands in for the ChannelWorkerPool, runs every job right away so the replay is measured end to end"""
+
+    def submit(self, channel, func, *args):
+        func(*args)
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class OfflineStatus:
+    """Stands in for TwitchStatus so the replay doesn't need the twitch api"""
+
+    def get_status(self, channel):
+        return {"live": False, "activity": "Prechat"}
+
+    def is_subscribed_to(self, channel):
+        return True
+
+    def get_clip_title(self, id):
+        return "No title found "
+
+    def add_channel(self, channel):
+        pass
+
+    def delete_channel(self, channel):
+        pass
+
+
+def timed(func, timings: dict):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            calls, total = timings.get(func.__name__, (0, 0.0))
+            timings[func.__name__] = (calls + 1, total + time.perf_counter() - start)
+
+    return wrapper
+
+
+def time_handlers(bot: TwitchChat, timings: dict):
+    for registry in [bot.admins, bot.command, bot.clearchat, bot.notice, bot.commands]:
+        for name, func in list(registry.items()):
+            registry[name] = timed(func, timings)
+
+
+def replay(bot: TwitchChat, lines: list, client: StubClient, timings: dict) -> float:
+    """Feeds every line through bot.handle_message and returns the seconds it took"""
+    time_handlers(bot, timings)
+    start = time.perf_counter()
+    for line in lines:
+        bot.handle_message(line, client)
+    return time.perf_counter() - start
+
+
+def main(fp: str):
+    lines = [line for ts, line in read_capture(fp)]
+    channels = set()
+    commands_seen = {}
+    for line in lines:
+        message = parse(line)
+        if message is not None:
+            commands_seen[message.command] = commands_seen.get(message.command, 0) + 1
+            if message.channel is not None:
+                channels.add(message.channel)
+    bot = TwitchChat(username, admin, oauth, sorted(channels), OfflineStatus(), interactive=False, **scratch_files())
+    sink = OutboundSink()
+    bot.connections = sink
+    bot.workers = InlineWorkers()
+    for channel in channels:
+        if len(bot.state.get(channel, {})) == 0:
+            bot.state[channel] = {}
+            bot.toggle_channel(channel, ToggleType.ON)
+    client = StubClient()
+    timings = {}
+    elapsed = replay(bot, lines, client, timings)
+
+    print("Replayed {0} lines from {1} channels in {2:.3f}s: {3:.0f} messages/sec".format(
+        len(lines), len(channels), elapsed, len(lines) / elapsed if elapsed > 0 else 0))
+    print("Lines per irc command: {0}".format(commands_seen))
+    print("Outbound lines: {0} chat, {1} protocol".format(len(sink.sent), len(client.sent)))
+    print("{0:<30}{1:>10}{2:>14}{3:>14}".format("handler", "calls", "total ms", "avg us"))
+    for name, (calls, total) in sorted(timings.items(), key=lambda item: item[1][1], reverse=True):
+        print("{0:<30}{1:>10}{2:>14.1f}{3:>14.1f}".format(name, calls, total * 1000, total / calls * 1000000))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("you need to give the capture to replay")
+    else:
+        main(sys.argv[1])
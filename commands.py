@@ -6,7 +6,7 @@
     @admin = This will call the command only when the admin of the bot (bot defined in ChatBot.py or credentials.py)
              types the command in chat
     @returns = This is for commands where other commands shouldn't run
-    @save = called in save method every 10 minutes.
+    @save = called in save method every 10 minutes, stores are only written to disk when they changed.
     @notice = This will call the command when an USERNOTICE is send in chat.
 
 
@@ -17,8 +17,10 @@ import os
 
 from utility import *
 from utility import rbac
+from utility import sqlite_store
 import functools
 import re
+from threading import Lock
 import urllib3
 import enchant
 import time
@@ -58,17 +60,38 @@ line_pickers = {
     "halloween": RandomLinePicker("texts/halloween.txt")
 }
 
+# roles, alts, grants, custom commands and rps scores are in sqlite instead of text files once it's imported
+SQLITE = sqlite_store.enabled()
+if "journal" not in globals():
+    # first import, reload keeps using the open journal and rbac isn't reloaded
+    journal = Journal(JOURNAL_FILE, JOURNAL_FUNCTIONS)
+    if not SQLITE:
+        rbac.users = LockedData(rbac.users.data, journal, "users")
+
 lurkers = dict()
 previous_lurker_ts = time.time() - 600
-ignore_list = LockedData(f.load("texts/ignore.txt", set()))
-alts = LockedData(f.load("texts/alts.txt", dict()))
+ignore_list = CopyOnWriteData(f.load("texts/ignore.txt", set()), journal, "ignore")
+alts = sqlite_store.open_store("alts") if SQLITE else LockedData(f.load("texts/alts.txt", dict()), journal, "alts")
 bad_words = f.load("texts/bad_words.txt", [])
-streaks = LockedData(f.load("texts/streaks.txt", {}))
+streaks = LockedData({channel: StreakTable(channel_streaks) for channel, channel_streaks in
+                      f.load("texts/streaks.txt", {}).items()})
 origins = f.load("texts/emote_origins.txt")
 dictionary_words = LockedData(f.load("texts/dictionary.txt", []))
-commands = LockedData(f.load("texts/commands.txt", {}))
-rps_scores = LockedData(f.load("texts/rps.txt", {}))
-lacking_granted = LockedData(f.load("texts/grants.txt", {}))
+commands = sqlite_store.open_store("commands") if SQLITE else \
+    CopyOnWriteData(f.load("texts/commands.txt", {}), journal, "commands")
+rps_scores = sqlite_store.open_store("rps") if SQLITE else LockedData(f.load("texts/rps.txt", {}), journal, "rps")
+lacking_granted = sqlite_store.open_store("grants") if SQLITE else \
+    CopyOnWriteData(f.load("texts/grants.txt", {}), journal, "grants")
+
+
+def use_journal(new_journal: Journal):
+    """Journals the stores to new_journal from now on, benchmarks use it to keep their writes out of texts/"""
+    global journal
+    journal = new_journal
+    for store in [rbac.users, ignore_list, alts, commands, rps_scores, lacking_granted]:
+        if store.journal is not None:
+            store.journal = new_journal
+
 time_started = datetime.datetime.today()
 scrape_colour = False
 war = []
@@ -100,17 +123,58 @@ def load_emotes():
     return emote_dict
 
 
+def load_channel_emotes():
+    """Emotes that only exist in one channel, texts/emotes/(channel).txt"""
+    channel_emotes = {}
+    if os.path.isdir("texts/emotes"):
+        for file in os.listdir("texts/emotes"):
+            if file.endswith(".txt"):
+                channel_emotes[file[:-len(".txt")]] = f.load("texts/emotes/" + file, [])
+    return channel_emotes
+
+
 youtube = get_youtube_api()
-db = LockedData({"emotes": dict(), "mentions": []})
-emote_dict = LockedData(load_emotes())
+db = LockedData({"mentions": []})
+emote_dict = CopyOnWriteData(load_emotes())
+channel_emotes = CopyOnWriteData(load_channel_emotes())
+# index of the global emotes, shared by all channels
+emote_index = EmoteIndex(emote_dict.access(get_val, key="all_emotes"))
+# channel -> ChannelEmoteIndex of the global and that channel's emotes
+emote_indexes = {}
+emote_indexes_lock = Lock()
 blacklisted = f.load("texts/blacklisted.txt", [])
 afk = dict()
+# handlers of different channels run at the same time on the worker pool, checking and changing afk, war, blacklisted
+# and lurkers has to happen under this lock
+shared_state_lock = Lock()
 ID_cache = IDCache()
 
 
+def emote_index_of(channel):
+    """
+        The index lacks in channel are checked against, built the first time it's needed.
+    :return: ChannelEmoteIndex of channel, the global EmoteIndex if channel is None
+    """
+    if channel is None:
+        return emote_index
+    index = emote_indexes.get(channel)
+    if index is None:
+        with emote_indexes_lock:
+            index = emote_indexes.get(channel)
+            if index is None:
+                index = ChannelEmoteIndex(emote_index, EmoteIndex(channel_emotes.access(get_val, key=channel) or []))
+                emote_indexes[channel] = index
+    return index
+
+
 def reload():
-    global emote_dict, blacklisted
-    emote_dict = load_emotes()
+    global emote_dict, channel_emotes, emote_index, emote_indexes, blacklisted
+    with emote_indexes_lock:
+        emote_dict = CopyOnWriteData(load_emotes())
+        channel_emotes = CopyOnWriteData(load_channel_emotes())
+        emote_index = EmoteIndex(emote_dict.access(get_val, key="all_emotes"))
+        emote_indexes = {}
+    lack_of.cache_clear()
     blacklisted = f.load("texts/blacklisted.txt", [])
 
 
@@ -188,48 +252,41 @@ def unwrap_command_args(func):
 # SAVES
 
 client = pymongo.MongoClient("mongodb://{}:{}@127.0.0.1:27017/".format(mongo_credentials.user, mongo_credentials.pwd))
+# started and stopped by TwitchChat
+lack_stats = LackStatsWriter(client["twitch"]["lacks"])
 
 
 @save
 def save_emotes():
-    global db, client
-
-    def save_emotes_inner(temp_db, kwargs):
-        ts = datetime.datetime.utcnow()
-        for channel, collections in temp_db.get("emotes").items():
-            db = client[channel]
-            global_coll = db["global"]
-            global_coll.insert_one({"count": collections.get("count"), "timestamp": ts})
-            for emote, wrong_emotes in collections.items():
-                col = db[emote]
-                wrong_emotes_to_insert = []
-                if emote != "count":
-                    for (misspell, activity), count in wrong_emotes.items():
-                        item = {"count": count, "spelling": misspell, "activity": activity,
-                                "timestamp": ts}
-                        wrong_emotes_to_insert.append(item)
-                    col.insert_many(wrong_emotes_to_insert)
-        temp_db["emotes"] = dict()
-
-    db.access(save_emotes_inner)
-    # clear buffer for any emotes caught during saving
-    db.buffered_write(update_emotes)
+    global lack_stats
+    lack_stats.flush()
 
 
 @save
 def save_mentions():
     global db, client
 
-    def save_mentions_inner(mongo_db, kwargs):
-        if "client" in kwargs:
-            client = kwargs.get("client")
-            db = client["twitch"]
-            col = db["twitch"]
-            if len(mongo_db["mentions"]) != 0:
-                col.insert_many(mongo_db.get("mentions"))
-            mongo_db["mentions"] = []
+    def take_mentions(mongo_db, kwargs):
+        mentions = mongo_db["mentions"]
+        mongo_db["mentions"] = []
+        return mentions
 
-    db.access(save_mentions_inner, client=client)
+    def put_back_mentions(mongo_db, kwargs):
+        mongo_db["mentions"] = kwargs.get("mentions") + mongo_db["mentions"]
+
+    # only swapping the list holds the lock, not the insert
+    mentions = db.write(take_mentions)
+    if len(mentions) != 0:
+        try:
+            client["twitch"]["twitch"].insert_many(mentions)
+        except pymongo.errors.BulkWriteError as e:
+            # ordered insert, everything before the first error is in the database
+            db.write(put_back_mentions, mentions=mentions[e.details.get("nInserted", 0):])
+            raise
+        except pymongo.errors.PyMongoError:
+            # kept for the next save, the persister logs the error
+            db.write(put_back_mentions, mentions=mentions)
+            raise
     # clear buffer that might have build up during save
     db.buffered_write(append_to_list_in_dict)
 
@@ -237,16 +294,13 @@ def save_mentions():
 @save
 def save_ignore_list():
     global ignore_list
-    ignore_list.access(lambda lst, kwargs: f.save(lst, "texts/ignore.txt"))
-    # clear buffer
-    ignore_list.buffered_write(add_to_container)
-    ignore_list.buffered_write(delete_from_list)
+    ignore_list.save(lambda lst, kwargs: f.save(lst, "texts/ignore.txt"))
 
 
 @save
 def save_alts():
     global alts
-    alts.access(lambda alts_set, kwargs: f.save(alts_set, "texts/alts.txt"))
+    alts.save(lambda alts_set, kwargs: f.save(alts_set, "texts/alts.txt"))
     # clear buffer
     alts.buffered_write(write_to_dict)
 
@@ -254,9 +308,8 @@ def save_alts():
 @save
 def save_streaks():
     global streaks
-    streaks.access(lambda streaks, kwargs: f.save(streaks, "texts/streaks.txt"))
-    # clear buffer
-    streaks.buffered_write(update_streak_inner)
+    streaks.save(lambda streaks, kwargs: f.save({channel: table.to_dict() for channel, table in streaks.items()},
+                                                "texts/streaks.txt"))
 
 
 @save
@@ -266,20 +319,24 @@ def save_emotes_txt():
     def save_emotes_inner(data, kwargs):
         f.save(data["all_emotes"], "texts/emotes.txt")
 
-    emote_dict.access(save_emotes_inner)
-    # clear buffer
-    emote_dict.access(append_to_list_in_dict)
-    emote_dict.access(write_to_dict)
+    def save_channel_emotes_inner(data, kwargs):
+        os.makedirs("texts/emotes", exist_ok=True)
+        for channel, emotes in data.items():
+            f.save(emotes, "texts/emotes/" + channel + ".txt")
+
+    emote_dict.save(save_emotes_inner)
+    channel_emotes.save(save_channel_emotes_inner)
 
 
 @save
 def save_user_roles():
-    rbac.users.access(lambda db, kwargs: f.save(db, "texts/user_roles.txt"))
+    rbac.users.save(lambda db, kwargs: f.save(db, "texts/user_roles.txt"))
 
 
 @save
 def save_blacklist():
-    f.save(blacklisted, "texts/blacklisted.txt")
+    with shared_state_lock:
+        f.save(blacklisted, "texts/blacklisted.txt")
 
 
 @save
@@ -287,7 +344,7 @@ def save_dictionary_words():
     def save_dictionary_inner(data, kwargs):
         f.save(data, "texts/dictionary.txt")
 
-    dictionary_words.access(save_dictionary_inner)
+    dictionary_words.save(save_dictionary_inner)
 
 
 @save
@@ -295,7 +352,7 @@ def save_commands():
     def save_commands_inner(data, kwargs):
         f.save(data, "texts/commands.txt")
 
-    commands.access(save_commands_inner)
+    commands.save(save_commands_inner)
 
 
 @save
@@ -303,7 +360,7 @@ def save_rps_scores():
     def save_rps_inner(data, kwargs):
         f.save(data, "texts/rps.txt")
 
-    rps_scores.access(save_rps_inner)
+    rps_scores.save(save_rps_inner)
 
 
 @save
@@ -313,7 +370,7 @@ def save_grants():
     def save_grants_inner(data, kwargs):
         f.save(data, "texts/grants.txt")
 
-    lacking_granted.access(save_grants_inner)
+    lacking_granted.save(save_grants_inner)
 
 
 # ADMIN
@@ -416,7 +473,7 @@ def delete_alt(bot: 'TwitchChat', args, msg, username, channel, send: bool):
     if match:
         alt = match.group(1)
         if alts.access(contains, elem=alt):
-            alts.access(delete_from_dict, key=alt)
+            alts.write(delete_from_dict, key=alt)
             message = Message(
                 "@" + username + ", pffft " + alt + " never heard of them PepeLaugh",
                 MessageType.CHAT,
@@ -464,25 +521,69 @@ def remove_line(bot: 'TwitchChat', args, msg, username, channel, send):
 @admin
 @unwrap_command_args
 def add_emote(bot: 'TwitchChat', args, msg, username, channel, send):
-    global emote_dict
-    match = re.match(r'!addemote\s(\w+)', msg)
+    """!addemote (emote) adds a global emote, !addemote (emote) here one that only exists in this channel"""
+    global emote_dict, channel_emotes
+
+    def add_emote_inner(data, kwargs):
+        data["all_emotes"].append(kwargs.get("emote"))
+        data[kwargs.get("emote").lower()] = data.get(kwargs.get("emote").lower(), [])
+        data[kwargs.get("emote").lower()].append(kwargs.get("emote"))
+
+    match = re.match(r'!addemote\s(\w+)(\shere)?', msg)
     if match:
         emote = match.group(1)
-        contains_check = emote_dict.access(contains, elem=emote.lower())
-        if contains_check and emote in emote_dict.access(get_val, key=emote.lower()):
+        if emote in emote_index_of(channel if match.group(2) else None):
             message = Message("Already know that emote (albeit in a lowered form) 4Weird", MessageType.COMMAND, channel,
                               username)
             bot.send_message(message)
-        elif contains_check:
-            emote_dict.buffered_write(append_to_list_in_dict, key="all_emotes", val=emote)
-            emote_dict.buffered_write(append_to_list_in_dict, key=emote.lower(), val=emote)
-            message = Message("I know " + emote + " now OkayChamp", MessageType.COMMAND, channel, username)
-            bot.send_message(message)
+            return
+        with emote_indexes_lock:
+            if match.group(2):
+                channel_emotes.write(append_to_list_in_dict, key=channel, val=emote)
+                if channel in emote_indexes:
+                    emote_indexes.get(channel).own.add(emote)
+            else:
+                emote_dict.write(add_emote_inner, emote=emote)
+                emote_index.add(emote)
+        lack_of.cache_clear()
+        message = Message("I know " + emote + " now OkayChamp", MessageType.COMMAND, channel, username)
+        bot.send_message(message)
+
+
+@admin
+@unwrap_command_args
+def remove_emote(bot: 'TwitchChat', args, msg, username, channel, send):
+    """!removeemote (emote) removes a global emote, !removeemote (emote) here one that only exists in this channel"""
+    global emote_dict, channel_emotes
+
+    def remove_emote_inner(data, kwargs):
+        data["all_emotes"].remove(kwargs.get("emote"))
+        data[kwargs.get("emote").lower()].remove(kwargs.get("emote"))
+        if len(data.get(kwargs.get("emote").lower())) == 0:
+            data.pop(kwargs.get("emote").lower())
+
+    match = re.match(r'!removeemote\s(\w+)(\shere)?', msg)
+    if match:
+        emote = match.group(1)
+        if match.group(2):
+            known = emote in (channel_emotes.access(get_val, key=channel) or [])
         else:
-            emote_dict.buffered_write(append_to_list_in_dict, key="all_emotes", val=emote)
-            emote_dict.buffered_write(write_to_dict, key=emote.lower(), val=[emote])
-            message = Message("I know " + emote + " now OkayChamp", MessageType.COMMAND, channel, username)
+            known = emote in emote_dict.access(get_val, key="all_emotes")
+        if not known:
+            message = Message("I don't know " + emote + " 4Head", MessageType.COMMAND, channel, username)
             bot.send_message(message)
+            return
+        with emote_indexes_lock:
+            if match.group(2):
+                channel_emotes.write(delete_from_list_in_dict, key=channel, val=emote)
+                if channel in emote_indexes:
+                    emote_indexes.get(channel).own.remove(emote)
+            else:
+                emote_dict.write(remove_emote_inner, emote=emote)
+                emote_index.remove(emote)
+        lack_of.cache_clear()
+        message = Message("Forgot about " + emote + " FeelsBadMan", MessageType.COMMAND, channel, username)
+        bot.send_message(message)
 
 
 @admin
@@ -556,7 +657,7 @@ def ignore_user(bot: 'TwitchChat', args, msg, username, channel, send):
     match = re.match(r'!ignore!\s(\w+)', msg.lower())
     if match:
         user = match.group(1)
-        ignore_list.access(add_to_container, elem=user)
+        ignore_list.write(add_to_container, elem=user)
         message = Message("Ignoring " + user + " from now on PrideLion", MessageType.COMMAND, channel, username)
         bot.send_message(message)
 
@@ -567,8 +668,9 @@ def blacklist_user(bot: 'TwitchChat', args, msg, username, channel, send):
     match = re.match(r'!blacklist\s(\w+)', msg.lower())
     if match:
         user = match.group(1)
-        if user not in blacklisted:
-            blacklisted.append(user)
+        with shared_state_lock:
+            if user not in blacklisted:
+                blacklisted.append(user)
         message = Message(user + " is now blacklisted", MessageType.COMMAND, channel, username)
         bot.send_message(message)
 
@@ -579,8 +681,9 @@ def unblacklist_user(bot: 'TwitchChat', args, msg, username, channel, send):
     match = re.match(r'!unblacklist\s(\w+)', msg.lower())
     if match:
         user = match.group(1)
-        if user in blacklisted:
-            blacklisted.remove(user)
+        with shared_state_lock:
+            if user in blacklisted:
+                blacklisted.remove(user)
         message = Message(user + " is now unblacklisted", MessageType.COMMAND, channel, username)
         bot.send_message(message)
 
@@ -592,7 +695,7 @@ def reset_streak(bot: 'TwitchChat', args, msg, username, channel, send):
     match = re.match(r'!reset\s([^\s]+)', msg)
     if match:
         emote = match.group(1)
-        streaks.access(reset_streak_inner, emote=emote, channel=channel)
+        streaks.write(reset_streak_inner, emote=emote, channel=channel)
         return True
     return False
 
@@ -605,7 +708,8 @@ def add_word(bot: 'TwitchChat', args, msg, username, channel, send):
     if match:
         new_word = match.group(1)
         dictionary.add(new_word)
-        dictionary_words.access(add_to_container, elem=new_word)
+        dictionary_words.write(add_to_container, elem=new_word)
+        lack_of.cache_clear()
         return True
     return False
 
@@ -622,7 +726,7 @@ def add_command(bot: 'TwitchChat', args, msg, username, channel, send):
                 "This command is already in use, if you want to overwrite this command use !addcommandf PrideLion",
                 MessageType.FUNCTIONAL, channel, username))
         else:
-            commands.access(write_to_dict, key=command_name, val=match.group(2))
+            commands.write(write_to_dict, key=command_name, val=match.group(2))
             bot.send_message(
                 Message(f"Command {command_name} added PrideLion", MessageType.FUNCTIONAL, channel, username))
 
@@ -634,7 +738,7 @@ def add_commandf(bot: 'TwitchChat', args, msg, username, channel, send):
     match = re.match(r'!addcommandf\s([a-zA-Z0-9_]*)\s(.*)', msg)
     if match:
         command_name = match.group(1)
-        commands.access(write_to_dict, key=command_name, val=match.group(2))
+        commands.write(write_to_dict, key=command_name, val=match.group(2))
         bot.send_message(Message(f"Command {command_name} added PrideLion", MessageType.FUNCTIONAL, channel, username))
 
 
@@ -646,7 +750,7 @@ def delete_command(bot: 'TwitchChat', args, msg, username, channel, send):
     if match:
         command_name = match.group(1)
         if commands.access(contains, elem=command_name):
-            commands.access(delete_from_dict, key=command_name)
+            commands.write(delete_from_dict, key=command_name)
             message = Message(f"command \"{command_name}\" was removed PrideLion", MessageType.FUNCTIONAL, channel,
                               username)
             bot.send_message(message)
@@ -662,7 +766,8 @@ def declare_war(bot: 'TwitchChat', args, msg, username, channel, send):
     global war
     match = re.match(r'!war\s@*([^\s]*)', msg.lower())
     if match:
-        war.append(match.group(1))
+        with shared_state_lock:
+            war.append(match.group(1))
         message = Message(f"Declared war on {match.group(1)} peepoWTF", MessageType.FUNCTIONAL, channel, username)
         bot.send_message(message)
 
@@ -674,8 +779,11 @@ def declare_truce(bot: 'TwitchChat', args, msg, username, channel, send):
     match = re.match(r'!truce\s@*([^\s]*)', msg.lower())
     if match:
         name = match.group(1)
-        if name in war:
-            war.remove(name)
+        with shared_state_lock:
+            removed = name in war
+            if removed:
+                war.remove(name)
+        if removed:
             message = Message("Truce PrideLion !", MessageType.FUNCTIONAL, channel, username)
             bot.send_message(message)
 
@@ -689,7 +797,7 @@ def grant_lack(bot: 'TwitchChat', args, msg, username, channel, send):
     if match:
         user = match.group(1).lower()
         lack = match.group(2)
-        lacking_granted.access(append_to_list_in_dict, key=user, val=lack)
+        lacking_granted.write(append_to_list_in_dict, key=user, val=lack)
 
         message = Message(f"{user} is granted access to saying {lack} PrideLion ", MessageType.COMMAND, channel,
                           username)
@@ -704,7 +812,7 @@ def ungrant_lack(bot: 'TwitchChat', args, msg, username, channel, send):
     if match:
         user = match.group(1).lower()
         lack = match.group(2)
-        lacking_granted.access(delete_from_list_in_dict, key=user, val=lack)
+        lacking_granted.write(delete_from_list_in_dict, key=user, val=lack)
         message = Message(f"{user} is no longer granted access to saying {lack} 4Weird ", MessageType.COMMAND, channel,
                           username)
         bot.send_message(message)
@@ -726,39 +834,43 @@ def ping_me(bot: 'TwitchChat', args, msg, username, channel, send):
 @unwrap_command_args
 def loop_over_words(bot: 'TwitchChat', args, msg, username, channel, send):
     global lacking_granted
-    words = msg.split()
+    # twitch tells which words are its own emotes, those don't need to be checked for lacks
+    native_emotes = emote_ranges(args.get("emotes"))
     username = username.lower()
     # static data
     counters = bot.state.get(username, {}).get("counters", {})
-    emotes = emote_dict.access(get_val, key="all_emotes")
+    emotes = emote_index_of(channel)
     unique_emotes = set()
-    wrong_emotes = []
+    candidates = []
     status = bot.twitch_status.get_status(channel)
     # static flags
     counters_check = username in bot.state and len(counters) != 0
     not_bot = not username == bot.user
-    for word in words:
+    for token in re.finditer(r"\S+", msg):
+        word = token.group()
+        is_native_emote = (token.start(), token.end() - 1) in native_emotes
         if word.lower() == "poooound" and bot.limiter.can_send(channel, "pound", 30, True):
             message = Message("Poooound", MessageType.SPAM, channel, username)
             bot.send_message(message)
         if counters_check and word in counters:
-            counters[word] = str(int(counters.get(word)) + 1)
-        if not_bot:
+            with bot.state_lock:
+                counters[word] = str(int(counters.get(word)) + 1)
+        if not_bot and not is_native_emote:
             # Using De morgan laws to turn not (a and b) to not a or not b turns this into harder to understand boolean
             if len(word) > 2 and not (word[0] == "\"" and word[-1] == "\""):
-                wrong_emote = validate_emotes(channel, status, word, emotes)
-                if wrong_emote is not None:
-                    wrong_emotes.append(wrong_emote)
-        if word in emotes and word not in unique_emotes and word != "WeirdChamp":
+                candidates.append(word)
+        if (is_native_emote or word in emotes) and word not in unique_emotes and word != "WeirdChamp":
             unique_emotes.add(word)
         match = re.match(r".*watch\?v=([a-zA-Z0-9\-_]+).*", word)
         if match:
             check_for_troll(bot, channel, username, match.group(1))
     update_streaks(unique_emotes, channel, username)
+    wrong_emotes = validate_emotes(channel, status, candidates)
     # Use data gathered
     if len(wrong_emotes) != 0:
-        amount = bot.state.get(channel).get("lacking", "0")
-        bot.state[channel]["lacking"] = str(int(amount) + len(wrong_emotes))
+        with bot.state_lock:
+            amount = bot.state.get(channel).get("lacking", "0")
+            bot.state[channel]["lacking"] = str(int(amount) + len(wrong_emotes))
         if send:
             wrong_emotes = list(filter(lambda lack: not is_granted(username.lower(), lack), wrong_emotes))
             if len(wrong_emotes) != 0:
@@ -801,54 +913,52 @@ def check_for_troll(bot: 'TwitchChat', channel: str, username: str, video_id: st
 
 def update_streaks(unique_emotes, channel, username):
     global streaks
-    streaks.buffered_write(update_streak_inner, emotes=unique_emotes, channel=channel)
+    streaks.write(update_streak_inner, emotes=unique_emotes, channel=channel)
 
 
-def validate_emotes(channel, status, word, emotes):
-    global emote_dict, db
+def validate_emotes(channel, status, words):
+    """
+        Checks all candidate words of a message in one go, repeated words are only validated once
+        and all lacks are counted with a single call.
+    :return: list of the lacks in words, in message order
+    """
+    global lack_stats
+    verdicts = {word: lack_of(word, channel) for word in set(words)}
+    lacks = [verdicts.get(word) for word in words if verdicts.get(word)[1] is not None]
+    if len(lacks) != 0:
+        lack_stats.add(channel, lacks, status.get("activity"))
+    return [wrong_emote for wrong_emote, correct_emote in lacks]
+
+
+@functools.lru_cache(maxsize=4096)
+def lack_of(word, channel):
+    """
+        Verdict for a word from chat in channel. Chat repeats the same words over and over so verdicts are cached,
+        anything that changes the emote indexes or the dictionary has to call lack_of.cache_clear().
+    :return: (cleaned up word, emote it's a lack of or None if it's fine)
+    """
+    index = emote_index_of(channel)
     word = cleanup(word)
-    lowered_word = word.lower()
-    if emote_dict.access(contains, elem=lowered_word):
-        correct_emotes = emote_dict.access(get_val, key=lowered_word)
+    correct_emotes = index.spellings(word.lower())
+    if len(correct_emotes) != 0:
         if word not in correct_emotes and not dictionary.check(word):
-            db.buffered_write(update_emotes, chan=channel, we=word, ce=correct_emotes[0], ac=status.get("activity"))
-            return word
+            return word, correct_emotes[0]
     else:
-        val = validate_emote(word, emotes)
-        if not val.boolean:
-            if not dictionary.check(word):
-                db.buffered_write(update_emotes, chan=channel, we=word, ce=val.correct, ac=status.get("activity"))
-                return word
-
-
-def validate_emote(emote, emotes):
-    for correct_emote in emotes:
-        dist = hammington(emote, correct_emote)
-        if dist == 1 or is_anagram(correct_emote, emote):
-            return Validation(False, correct_emote)
-    return Validation(True, emote)
+        val = validate_emote(word, index)
+        if not val.boolean and not dictionary.check(word):
+            return word, val.correct
+    return word, None
 
 
-def get_all_lacks(emote, emotes):
-    lacks = []
-    for correct_emote in emotes:
-        dist = hammington(emote, correct_emote)
-        if dist == 1 or is_anagram(correct_emote, emote):
-            lacks.append(correct_emote)
-    return lacks
+def validate_emote(emote, emotes: EmoteIndex):
+    correct_emote = emotes.find(emote)
+    if correct_emote is not None:
+        return Validation(False, correct_emote)
+    return Validation(True, emote)
 
 
-def update_emotes(db, kwargs) -> None:
-    if "chan" in kwargs and "we" in kwargs and "ce" in kwargs and "ac" in kwargs:
-        channel, wrong_emote, correct_emote, activity = kwargs.get("chan"), kwargs.get("we"), \
-                                                        kwargs.get("ce"), kwargs.get("ac")
-        db["emotes"][channel] = db.get("emotes").get(channel, dict())
-        channel_dict = db.get("emotes").get(channel)
-        channel_dict[correct_emote] = channel_dict.get(correct_emote, dict())
-        emote_dict = channel_dict.get(correct_emote)
-        count = emote_dict.get((wrong_emote, activity), 0)
-        emote_dict[(wrong_emote, activity)] = count + 1
-        channel_dict["count"] = channel_dict.get("count", 0) + 1
+def get_all_lacks(emote, emotes: EmoteIndex):
+    return emotes.find_all(emote)
 
 
 @command
@@ -921,8 +1031,9 @@ def card_pogoff(bot: 'TwitchChat', args, msg, username, channel, send: bool):
 @command
 @unwrap_command_args
 def check_if_afk(bot: 'TwitchChat', args, msg, username, channel, send: bool):
-    if username in afk:
-        afk.pop(username)
+    with shared_state_lock:
+        was_afk = afk.pop(username, None) is not None
+    if was_afk:
         message = Message("@" + username + ", " + line_pickers.get("greetings").get_line() + " " +
                           line_pickers.get("friends").get_line() + " PrideLion ",
                           MessageType.HELPFUL, channel, username)
@@ -933,8 +1044,9 @@ def check_if_afk(bot: 'TwitchChat', args, msg, username, channel, send: bool):
 @unwrap_command_args
 def notify_afk(bot: 'TwitchChat', args, msg, username, channel, send: bool):
     for word in msg.lower().split():
-        if word in afk:
-            message = Message("that user is afk for: " + afk.get(word), MessageType.SPAM, channel, credentials.username)
+        reason = afk.get(word)
+        if reason is not None:
+            message = Message("that user is afk for: " + reason, MessageType.SPAM, channel, credentials.username)
             bot.send_message(message)
 
 
@@ -999,33 +1111,35 @@ def send_pog(bot: 'TwitchChat', args):
         type_sub = subscriber_type(amount_of_months)
         message = Message("POGGIES " + type_sub + "!", MessageType.SUBSCRIBER, channel, username)
         bot.send_message(message)
-        bot.state["lonewulfx6"]["counters"]["POGGIES"] = str(
-            int(bot.state.get("lonewulfx6").get("counters").get("POGGIES")) + 1)
+        count_poggies(bot)
     elif tipe == "subgift":
         amount_of_gifts = args.get("msg-param-sender-count")
         if amount_of_gifts != "0" and amount_of_gifts is not None:
             message = Message("POGGIES " + amount_of_gifts + " gifts! Bitch you crazy!",
                               MessageType.SUBSCRIBER, channel, username)
             bot.send_message(message)
-            bot.state["lonewulfx6"]["counters"]["POGGIES"] = str(
-                int(bot.state.get("lonewulfx6").get("counters").get("POGGIES")) + 1)
+            count_poggies(bot)
     elif tipe == "submysterygift":
         amount_of_gifts = args.get("msg-param-sender-count", "0")
         if amount_of_gifts != "0" and amount_of_gifts is not None:
             message = Message("POGGIES " + amount_of_gifts + " gifts! Bitch you crazy!",
                               MessageType.SUBSCRIBER, channel, username)
             bot.send_message(message)
-            bot.state["lonewulfx6"]["counters"]["POGGIES"] = str(
-                int(bot.state.get("lonewulfx6").get("counters").get("POGGIES")) + 1)
+            count_poggies(bot)
     elif tipe == "anonsubgift":
         message = Message("POGGIES", MessageType.SUBSCRIBER, channel, username)
         bot.send_message(message)
-        bot.state["lonewulfx6"]["counters"]["POGGIES"] = str(
-            int(bot.state.get("lonewulfx6").get("counters").get("POGGIES")) + 1)
+        count_poggies(bot)
     else:
         return
 
 
+def count_poggies(bot: 'TwitchChat'):
+    with bot.state_lock:
+        counters = bot.state.get("lonewulfx6").get("counters")
+        counters["POGGIES"] = str(int(counters.get("POGGIES")) + 1)
+
+
 def subscriber_type(months):
     if months is None:
         return ""
@@ -1070,7 +1184,7 @@ def toggle_scrape(bot: 'TwitchChat', args, msg, username, channel, send):
 def add_to_ignore(bot: 'TwitchChat', args, msg, username, channel, send):
     global ignore_list
     if not ignore_list.access(contains, elem=username):
-        ignore_list.buffered_write(add_to_container, elem=username)
+        ignore_list.write(add_to_container, elem=username)
         message = Message("@" + username + ", from now on you will be ignored PrideLion", MessageType.COMMAND,
                           channel, username)
         bot.send_message(message)
@@ -1084,7 +1198,7 @@ def add_to_ignore(bot: 'TwitchChat', args, msg, username, channel, send):
 def remove_from_ignore(bot: 'TwitchChat', args, msg, username, channel, send):
     global ignore_list
     if ignore_list.access(contains, elem=username):
-        ignore_list.buffered_write(delete_from_set, elem=username)
+        ignore_list.write(delete_from_set, elem=username)
         message = Message("@" + username + ", welcome back PrideLion !", MessageType.COMMAND, channel, username)
         bot.send_message(message)
     else:
@@ -1097,11 +1211,8 @@ http = urllib3.PoolManager()
 
 def english_dictionary():
     global dictionary_words
-    english_dict = enchant.Dict("en_US")
-    current_words = dictionary_words.access(get_data)
-    for word in current_words:
-        english_dict.add(word)
-    return english_dict
+    # custom words stay out of enchant, EnglishDictionary checks them itself
+    return EnglishDictionary(enchant.Dict("en_US"), dictionary_words.access(get_data))
 
 
 dictionary = english_dictionary()
@@ -1150,8 +1261,9 @@ def addcounter(bot: 'TwitchChat', args, msg, username, channel, send):
                 bot.send_message(message)
                 return True
             # Add the counter for the user that used this command
-            bot.state[username] = bot.state.get(username, dict())
-            bot.state[username]["counters"] = bot.state.get(username).get("counters", {})
+            with bot.state_lock:
+                bot.state[username] = bot.state.get(username, dict())
+                bot.state[username]["counters"] = bot.state.get(username).get("counters", {})
             counters = bot.state.get(username).get("counters")
             if len(counters) < 5:
                 if val_or_user not in counters:
@@ -1189,8 +1301,9 @@ def addcounter(bot: 'TwitchChat', args, msg, username, channel, send):
             val_or_user = val_or_user.lower()
             if username.lower() == val_or_user.lower() or username in bot.admin:
                 # add the counter for the username mentione with
-                bot.state[val_or_user] = bot.state.get(val_or_user, dict())
-                bot.state[val_or_user]["counters"] = bot.state.get(val_or_user).get("counters", {})
+                with bot.state_lock:
+                    bot.state[val_or_user] = bot.state.get(val_or_user, dict())
+                    bot.state[val_or_user]["counters"] = bot.state.get(val_or_user).get("counters", {})
                 counters = bot.state.get(val_or_user).get("counters")
                 if len(counters) < 5:
                     if val not in counters:
@@ -1307,12 +1420,11 @@ def whois(bot: 'TwitchChat', args, msg, username, channel, send: bool):
 @alias("correct")
 @unwrap_command_args
 def correct(bot: 'TwitchChat', args, msg, username, channel, send):
-    global emote_dict
     match = re.match(r"!correct (\w+)", msg)
     if match:
         emote = match.group(1)
-        correct_emotes = emote_dict.access(get_val, key=emote.lower())
-        if correct_emotes is not None:
+        correct_emotes = emote_index_of(channel).spellings(emote.lower())
+        if len(correct_emotes) != 0:
             if "WeirdChamp" in correct_emotes and not bot.twitch_status.is_subscribed_to(channel):
                 message = Message("@" + username + " can't fool me PepeLaugh", MessageType.COMMAND, channel, username)
                 bot.send_message(message)
@@ -1342,12 +1454,12 @@ def correct(bot: 'TwitchChat', args, msg, username, channel, send):
 @alias("reason_lack")
 @unwrap_command_args
 def lacking_for(bot: 'TwitchChat', args, msg, username, channel, send):
-    global emote_dict
     match = re.match(r"!reason_lack\s+([^\s]*)", msg)
     if match:
         word = match.group(1)
-        direct_match = emote_dict.access(get_val, key=word.lower())
-        all_lacks = get_all_lacks(word, emote_dict.access(get_val, key="all_emotes"))
+        index = emote_index_of(channel)
+        direct_match = index.spellings(word.lower())
+        all_lacks = get_all_lacks(word, index)
         if direct_match and word != direct_match:
             message = Message(
                 f"@{username}, the reason {word} counts as a lack is because of {', '.join(direct_match)}",
@@ -1383,9 +1495,10 @@ def lurk(bot: 'TwitchChat', args, msg, username, channel, send):
     if len(lurkers.get(channel, [])) == 0 or time.time() - previous_lurker_ts > 600:
         js = http.request("GET", "https://tmi.twitch.tv/group/user/" + channel + "/chatters").data.decode("UTF-8")
         chatters = json.loads(js)
-        lurkers[channel] = chatters.get("chatters").get("viewers")
-        lurkers[channel] = [None] if len(lurkers.get(channel)) == 0 else lurkers.get(channel)
-        previous_lurker_ts = time.time()
+        viewers = chatters.get("chatters").get("viewers")
+        with shared_state_lock:
+            lurkers[channel] = [None] if len(viewers) == 0 else viewers
+            previous_lurker_ts = time.time()
     if bot.limiter.can_send(channel, "lurker", 1200, True):
         lurker = random.choice(lurkers.get(channel, [None]))
         txt = lurker + " is lurking in chat right now monkaW ." \
@@ -1505,7 +1618,7 @@ def pyramid(bot: 'TwitchChat', args, msg, username, channel, send):
             return True
         else:
             pyramid_emotes = match.group(2).split()
-            correct_emotes = emote_dict.access(get_val, key="all_emotes")
+            correct_emotes = emote_index_of(channel)
             for emote in pyramid_emotes:
                 if emote not in correct_emotes:
                     return True
@@ -1595,7 +1708,8 @@ def unique(bot: 'TwitchChat', args, msg, username, channel, send):
 @unwrap_command_args
 def jouch(bot: 'TwitchChat', args, msg, username, channel, send):
     if bot.limiter.can_send(channel, "jouch", 20):
-        emote = random.choice(emote_dict.access(get_val, key="all_emotes"))
+        emote = random.choice(emote_dict.access(get_val, key="all_emotes") +
+                              (channel_emotes.access(get_val, key=channel) or []))
         if emote == "WeirdChamp":
             if bot.twitch_status.is_subscribed_to(channel):
                 message = Message(emote + " on da Jouch ", MessageType.COMMAND, channel, username)
@@ -1612,7 +1726,7 @@ def generate(bot: 'TwitchChat', args, msg, username, channel, send):
     match = re.match(r'!generate\s(\w+)', msg)
     if match:
         emote = match.group(1)
-        if emote in emote_dict.access(get_val, key="all_emotes") and bot.limiter.can_send(channel, "generate", 30):
+        if emote in emote_index_of(channel) and bot.limiter.can_send(channel, "generate", 30):
             emote += " "
             emote *= random.randint(1, 8)
             message = Message(emote, MessageType.SPAM, channel, username)
@@ -1628,7 +1742,7 @@ def streak(bot: 'TwitchChat', args, msg, username, channel, send):
             if "emote" in kwargs and "channel" in kwargs:
                 emote = kwargs.get("emote")
                 channel = kwargs.get("channel")
-                if emote in dct.get(channel, {}):
+                if channel in dct:
                     return dct.get(channel).get(emote)
 
         emote = match.group(1)
@@ -1663,12 +1777,9 @@ def top_streaks(bot: 'TwitchChat', args, msg, username, channel, send):
             if "channel" in kwargs and "amount" in kwargs:
                 channel = kwargs.get("channel")
                 amount = kwargs.get("amount")
-                streaks = []
-                dct[channel] = dct.get(channel, {})
-                for emote, streak in dct[channel].items():
-                    streaks.append((emote, streak["max"]))
-                streaks.sort(key=lambda tup: int(tup[1]), reverse=True)
-                return streaks[:amount]
+                if channel not in dct:
+                    return []
+                return dct.get(channel).top(amount)
 
         top = streaks.access(get_top_10_streaks, channel=channel, amount=amount)
         if len(top) != 0:
@@ -1717,7 +1828,8 @@ def going_afk(bot: 'TwitchChat', args, msg, username, channel, send):
             message = Message("Can't fool me PepeLaugh", MessageType.COMMAND, channel, username)
             bot.send_message(message)
             return True
-        afk[username] = reason
+        with shared_state_lock:
+            afk[username] = reason
         message = Message("@" + username + ", " + line_pickers.get("byes").get_line() + " " +
                           line_pickers.get("friends").get_line() + " PrideLion",
                           MessageType.HELPFUL, channel, username)
@@ -1923,15 +2035,15 @@ def rps(bot: 'TwitchChat', args, msg, username, channel, send):
                 if outcome == Outcome.WON:
                     message = Message(f"@{username}, You won PrideLion ! I chose {str(bot_symbol)}",
                                       MessageType.SPAM, channel, username)
-                    rps_scores.access(add_win, user=username)
+                    rps_scores.write(add_win, user=username)
                 elif outcome == Outcome.LOST:
                     message = Message(f"@{username}, You lost PrideLion ! I chose {str(bot_symbol)}",
                                       MessageType.SPAM, channel, username)
-                    rps_scores.access(add_loss, user=username)
+                    rps_scores.write(add_loss, user=username)
                 else:
                     message = Message(f"@{username}, We tied PrideLion ! I chose {str(bot_symbol)}",
                                       MessageType.SPAM, channel, username)
-                    rps_scores.access(add_tie, user=username)
+                    rps_scores.write(add_tie, user=username)
                 bot.send_message(message)
 
 
@@ -1,2 +0,0 @@
-from .asyncore import *
-from .asynchat import *
\ No newline at end of file
@@ -0,0 +1,55 @@
+import queue
+import socketserver
+import threading
+import unittest
+from twitchchat.client import IrcClient
+
+
+class LineHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            self.server.lines.put(line.decode("UTF-8"))
+
+
+class IrcClientRestartTest(unittest.TestCase):
+    def setUp(self):
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), LineHandler)
+        self.server.daemon_threads = True
+        self.server.lines = queue.Queue()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.connected = queue.Queue()
+        self.client = IrcClient("127.0.0.1:{0}".format(self.server.server_address[1]), lambda line, client: None,
+                                lambda client: self.connected.put(client))
+
+    def tearDown(self):
+        self.client.stop()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def send_and_receive(self, line: str):
+        self.client.send_message(line)
+        self.assertEqual(self.server.lines.get(timeout=5), line)
+
+    def test_sends_after_a_restart(self):
+        for i in range(3):
+            self.client.start()
+            self.connected.get(timeout=5)
+            self.send_and_receive("PING :{0}\r\n".format(i))
+            self.send_and_receive("PRIVMSG #channel :{0}\r\n".format(i))
+            self.client.stop()
+            self.assertTrue(self.client.loop.is_closed())
+
+    def test_lines_queued_before_the_connection_are_sent(self):
+        self.client.start()
+        self.send_and_receive("PASS oauth:secret\r\n")
+
+    def test_failed_connection_is_logged(self):
+        self.server.shutdown()
+        self.server.server_close()
+        with self.assertLogs(self.client.logger, "ERROR"):
+            self.client.start()
+            self.client.loop_thread.join(5)
+
+
+if __name__ == "__main__":
+    unittest.main()
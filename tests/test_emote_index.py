@@ -0,0 +1,75 @@
+import random
+import string
+import unittest
+from utility.classes import EmoteIndex, ChannelEmoteIndex
+from utility.functions import hammington, is_anagram
+
+
+def linear_find_all(word, emotes):
+    """The scan over every emote the index replaces"""
+    return [emote for emote in emotes if emote is not None and (hammington(word, emote) == 1 or is_anagram(emote, word))]
+
+
+def variations(emote, rnd):
+    """Words close to emote: case changes, one letter changed, swapped letters and longer or shorter words"""
+    i = rnd.randrange(len(emote))
+    letter = rnd.choice("aAbBkKpP")
+    shuffled = list(emote)
+    rnd.shuffle(shuffled)
+    return [emote, emote.lower(), emote.upper(), emote[:i] + letter + emote[i + 1:], "".join(shuffled),
+            emote + letter, emote[:-1], letter + emote[1:]]
+
+
+class EmoteIndexTest(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(18)
+        letters = "aAbBkKpPeE"
+        self.emotes = ["Kappa", "KAPPA", "kappa", "Kappu", "PogChamp", "pepeLaugh", "LUL", "LuL", "a", "ab", "ba"]
+        self.emotes += ["".join(rnd.choice(letters) for _ in range(rnd.randint(1, 6))) for _ in range(200)]
+        self.words = [word for emote in self.emotes for word in variations(emote, rnd)]
+        self.words += ["".join(rnd.choice(letters) for _ in range(rnd.randint(1, 7))) for _ in range(1000)]
+        self.words += ["", string.punctuation]
+
+    def test_same_results_as_the_linear_scan(self):
+        index = EmoteIndex(self.emotes)
+        for word in self.words:
+            lacks = linear_find_all(word, self.emotes)
+            self.assertEqual(index.find_all(word), lacks, word)
+            self.assertEqual(index.find(word), lacks[0] if len(lacks) != 0 else None, word)
+
+    def test_same_results_after_removing_emotes(self):
+        index = EmoteIndex(self.emotes)
+        emotes = list(self.emotes)
+        for emote in self.emotes[::3]:
+            self.assertTrue(index.remove(emote))
+            emotes[emotes.index(emote)] = None
+        self.assertFalse(index.remove("NotAnEmote"))
+        for word in self.words:
+            self.assertEqual(index.find_all(word), linear_find_all(word, emotes), word)
+        index.add("Kappa")
+        self.assertIn("Kappa", index)
+        self.assertEqual(index.find_all("Kapap")[-1], "Kappa")
+
+    def test_contains_and_spellings(self):
+        index = EmoteIndex(["Kappa", "KAPPA", "Kappa"])
+        self.assertIn("Kappa", index)
+        self.assertNotIn("kappa", index)
+        self.assertEqual(index.spellings("kappa"), ["Kappa", "KAPPA", "Kappa"])
+        index.remove("Kappa")
+        self.assertIn("Kappa", index)
+        index.remove("Kappa")
+        self.assertNotIn("Kappa", index)
+
+    def test_channel_emotes_come_after_the_shared_ones(self):
+        shared = self.emotes[:100]
+        own = self.emotes[100:]
+        index = ChannelEmoteIndex(EmoteIndex(shared), EmoteIndex(own))
+        for word in self.words:
+            lacks = linear_find_all(word, shared + own)
+            self.assertEqual(index.find_all(word), lacks, word)
+            self.assertEqual(index.find(word), lacks[0] if len(lacks) != 0 else None, word)
+        self.assertIn(own[0], index)
+
+
+if __name__ == "__main__":
+    unittest.main()
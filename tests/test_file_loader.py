@@ -0,0 +1,56 @@
+import os
+import tempfile
+import unittest
+from utility import file_loader as f
+
+
+class FileLoaderTest(unittest.TestCase):
+    def round_trip(self, obj):
+        self.assertEqual(f.from_text(f.clean_txt(f.to_txt(obj))), obj)
+        self.assertEqual(f.from_text(f.clean_txt(f.to_pretty_txt(obj))), obj)
+
+    def test_nested_iterables_round_trip(self):
+        self.round_trip({
+            "channel": {"lacking": "12", "toggle": "ON", "emotes": ["Kappa", "PogChamp"]},
+            "user": {"counters": {}, "alts": [], "seen": ("2020", "10", "18")},
+            "words": {("a", "b"), "c"},
+            "empty": {},
+        })
+        self.round_trip([[], [[]], ["a", ["b", ("c",)]], {"k": ["v"]}])
+
+    def test_escaped_text_round_trips(self):
+        self.round_trip({"key:with:colons": "spaces, and commas", "x": ["a b", "c,d"]})
+
+    def test_values_with_brackets(self):
+        # brackets anywhere but at the start of a value are part of it
+        self.round_trip(["hi (there)", "1 [and] {2}", "last"])
+        self.round_trip({"command": "use {[this]} (or that)"})
+        # a closing bracket without an opening one is part of the value
+        self.assertEqual(f.from_text("[swell-_-sharks),next]"), ["swell sharks)", "next"])
+
+    def test_irregular_text(self):
+        self.assertEqual(f.from_text("[a,,b]"), ["a", None, "b"])
+        self.assertEqual(f.from_text("[a,]"), ["a"])
+        self.assertEqual(f.from_text("{k:}"), {"k": None})
+        self.assertEqual(f.from_text("[a]x"), ["a]"])
+        self.assertEqual(f.from_text("{k:[a]x}"), {"k": ["a]"]})
+        self.assertEqual(f.from_text("({x}:(),y)"), ({"x}": ()}, "y"))
+        self.assertEqual(f.from_text("[a,[b"), ["a", []])
+        self.assertIsNone(f.from_text(""))
+        with self.assertRaises(ValueError):
+            f.from_text("{k:v,w}")
+
+    def test_all_items(self):
+        self.assertEqual(f.all_items("a,[b,c],{d:(e,f)},"), ["a", "[b,c]", "{d:(e,f)}"])
+
+    def test_save_and_load(self):
+        fp = os.path.join(tempfile.mkdtemp(), "state.txt")
+        obj = {"user": {"counters": {"Kappa": "3"}, "alts": ["alt one"]}}
+        f.save(obj, fp)
+        self.assertEqual(f.load(fp), obj)
+        self.assertFalse(os.path.exists(fp + ".tmp"))
+        self.assertEqual(f.load(os.path.join(os.path.dirname(fp), "missing.txt"), {}), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+from twitchchat.framing import LineFramer
+
+
+class LineFramerTest(unittest.TestCase):
+    def test_crlf_and_lf_lines(self):
+        framer = LineFramer()
+        self.assertEqual(framer.feed(b"PING :a\r\nPING :b\nPING :c\r\n"), ["PING :a", "PING :b", "PING :c"])
+        self.assertEqual(framer.feed(b"\r\n\n"), ["", ""])
+
+    def test_line_split_over_chunks(self):
+        framer = LineFramer()
+        self.assertEqual(framer.feed(b"PING :a\r\nPRIVMSG #chan"), ["PING :a"])
+        self.assertEqual(framer.feed(b"nel :hel"), [])
+        self.assertEqual(framer.feed(b"lo\r"), [])
+        self.assertEqual(framer.feed(b"\nPING :b\r\n"), ["PRIVMSG #channel :hello", "PING :b"])
+
+    def test_multibyte_character_split_over_chunks(self):
+        data = "PRIVMSG #channel :héllo ❤\r\n".encode("utf-8")
+        cut = data.index("❤".encode("utf-8")) + 1
+        framer = LineFramer()
+        self.assertEqual(framer.feed(data[:cut]), [])
+        self.assertEqual(framer.feed(data[cut:]), ["PRIVMSG #channel :héllo ❤"])
+
+    def test_every_split_of_a_stream(self):
+        data = "a\r\nbé\nc\r\n\r\nd ❤ e\n".encode("utf-8")
+        expected = ["a", "bé", "c", "", "d ❤ e"]
+        for first in range(len(data) + 1):
+            for second in range(first, len(data) + 1):
+                framer = LineFramer()
+                lines = framer.feed(data[:first]) + framer.feed(data[first:second]) + framer.feed(data[second:])
+                self.assertEqual(lines, expected, (first, second))
+
+    def test_invalid_utf8_is_replaced(self):
+        self.assertEqual(LineFramer().feed(b"PING :\xff\r\n"), ["PING :�"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+import os
+import tempfile
+import unittest
+from utility.classes import Journal, LockedData
+from utility.locked_data_functions import JOURNAL_FUNCTIONS, write_to_dict
+
+
+class JournalRestartTest(unittest.TestCase):
+    def setUp(self):
+        self.fp = os.path.join(tempfile.mkdtemp(), "journal.txt")
+
+    def test_writes_after_a_clean_restart_survive_a_crash(self):
+        journal = Journal(self.fp, JOURNAL_FUNCTIONS)
+        store = LockedData({}, journal, "alts")
+        for i in range(5):
+            store.write(write_to_dict, key="alt{0}".format(i), val="main")
+        snapshot = {}
+        store.save(lambda data, kwargs: snapshot.update(data))
+        journal.compact()
+        journal.close()
+
+        # restart on the saved snapshot, write and crash without saving
+        journal = Journal(self.fp, JOURNAL_FUNCTIONS)
+        store = LockedData(dict(snapshot), journal, "alts")
+        store.write(write_to_dict, key="new0", val="main")
+        store.write(write_to_dict, key="new1", val="main")
+        journal.close()
+
+        journal = Journal(self.fp, JOURNAL_FUNCTIONS)
+        data = dict(snapshot)
+        self.assertEqual(journal.replay("alts", data), 2)
+        self.assertEqual(data, dict(snapshot, new0="main", new1="main"))
+        journal.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from pymongo.errors import AutoReconnect, BulkWriteError
+from utility.classes import LackStatsWriter
+
+
+class FakeCollection:
+    """Applies the $inc upserts of bulk_write, failures are queued up front"""
+
+    def __init__(self):
+        self.documents = {}
+        self.calls = []
+        # per bulk_write call: None to write everything, a list of indexes that fail or an exception to raise
+        self.failures = []
+
+    def bulk_write(self, operations, ordered=True):
+        self.calls.append(len(operations))
+        failure = self.failures.pop(0) if len(self.failures) != 0 else None
+        if isinstance(failure, Exception):
+            raise failure
+        failed = failure or []
+        for i, operation in enumerate(operations):
+            if i not in failed:
+                key = tuple(sorted(operation._filter.items()))
+                self.documents[key] = self.documents.get(key, 0) + operation._doc.get("$inc").get("count")
+        if len(failed) != 0:
+            raise BulkWriteError({"writeErrors": [{"index": i, "code": 11000} for i in failed], "nInserted": 0,
+                                  "nUpserted": len(operations) - len(failed)})
+
+    def counts(self) -> dict:
+        """spelling -> count of all stored documents"""
+        counts = {}
+        for key, count in self.documents.items():
+            spelling = dict(key).get("spelling")
+            counts[spelling] = counts.get(spelling, 0) + count
+        return counts
+
+
+class LackStatsWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.collection = FakeCollection()
+        self.writer = LackStatsWriter(self.collection, batch_size=2, bucket_seconds=3600)
+        self.writer.add("channel", [("Kapap", "Kappa"), ("Kapap", "Kappa"), ("LLU", "LUL")], "game")
+        self.writer.add("channel", [("PogChmap", "PogChamp"), ("pepeLuagh", "pepeLaugh")], "game")
+        self.expected = {"Kapap": 2, "LLU": 1, "PogChmap": 1, "pepeLuagh": 1}
+
+    def test_flush_writes_every_count_once(self):
+        self.writer.flush()
+        self.assertEqual(self.collection.calls, [2, 2])
+        self.assertEqual(self.collection.counts(), self.expected)
+        self.assertEqual(self.writer.pending(), 0)
+        self.assertEqual(self.writer.last_flush.get("documents"), 4)
+
+    def test_only_failed_writes_of_a_partial_failure_are_retried(self):
+        self.collection.failures = [None, [1]]
+        with self.assertLogs("lack_stats", "ERROR"):
+            self.writer.flush()
+        self.assertEqual(self.writer.pending(), 1)
+        self.writer.flush()
+        self.assertEqual(self.collection.counts(), self.expected)
+        self.assertEqual(self.writer.pending(), 0)
+
+    def test_failed_batch_and_the_ones_after_it_are_retried(self):
+        self.collection.failures = [AutoReconnect("connection lost")]
+        with self.assertLogs("lack_stats", "ERROR"):
+            self.writer.flush()
+        self.assertEqual(self.collection.calls, [2])
+        self.assertEqual(self.writer.pending(), 4)
+        self.writer.add("channel", [("Kapap", "Kappa")], "game")
+        self.writer.flush()
+        self.assertEqual(self.collection.counts(), dict(self.expected, Kapap=3))
+
+    def test_empty_flush_writes_nothing(self):
+        self.writer.flush()
+        self.writer.flush()
+        self.assertEqual(self.collection.calls, [2, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
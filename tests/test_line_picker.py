@@ -0,0 +1,40 @@
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from utility import file_loader as f
+from utility.classes import RandomLinePicker
+
+
+class RandomLinePickerTest(unittest.TestCase):
+    def setUp(self):
+        self.fp = os.path.join(tempfile.mkdtemp(), "lines.txt")
+        f.save(["line{0}".format(i) for i in range(50)], self.fp)
+
+    def test_every_line_is_said_once_before_repeating(self):
+        picker = RandomLinePicker(self.fp)
+        said = [picker.get_line() for _ in range(50)]
+        self.assertEqual(sorted(said), sorted(f.load(self.fp)))
+        self.assertIn(picker.get_line(), said)
+
+    def test_lines_picked_from_many_threads(self):
+        picker = RandomLinePicker(self.fp)
+        with ThreadPoolExecutor(8) as pool:
+            said = list(pool.map(lambda _: picker.get_line(), range(5000)))
+        self.assertEqual(len(said), 5000)
+        self.assertEqual(len(picker.lines) + len(picker.lines_said), 50)
+
+    def test_add_and_remove_save_all_lines(self):
+        picker = RandomLinePicker(self.fp)
+        said = picker.get_line()
+        picker.add_line("new line")
+        picker.add_line(said)
+        self.assertEqual(sorted(f.load(self.fp)), sorted(picker.lines + picker.lines_said))
+        self.assertEqual(len(f.load(self.fp)), 51)
+        picker.remove_line(said)
+        self.assertNotIn(said, f.load(self.fp))
+        self.assertEqual(len(f.load(self.fp)), 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
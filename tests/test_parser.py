@@ -0,0 +1,52 @@
+import unittest
+from twitchchat.parser import parse
+
+
+class ParserTest(unittest.TestCase):
+    def test_privmsg_with_tags(self):
+        message = parse("@badge-info=;color=#FF0000;display-name=User;emotes=25:0-4 "
+                        ":user!user@user.tmi.twitch.tv PRIVMSG #channel :Kappa hello : there")
+        self.assertEqual(message.command, "PRIVMSG")
+        self.assertEqual(message.tags, {"badge-info": "", "color": "#FF0000", "display-name": "User",
+                                        "emotes": "25:0-4"})
+        self.assertEqual(message.nick, "user")
+        self.assertEqual(message.channel, "channel")
+        self.assertEqual(message.trailing, "Kappa hello : there")
+
+    def test_to_args(self):
+        args = parse("@login=sub;msg-id=resub :tmi.twitch.tv USERNOTICE #channel :great stream").to_args()
+        self.assertEqual(args, {"login": "sub", "msg-id": "resub", "username": None, "channel": "channel",
+                                "message": "great stream"})
+
+    def test_without_tags_prefix_or_trailing(self):
+        message = parse("PING :tmi.twitch.tv")
+        self.assertEqual((message.command, message.params, message.trailing), ("PING", [], "tmi.twitch.tv"))
+        self.assertEqual(message.tags, {})
+        self.assertIsNone(message.prefix)
+        message = parse(":user!user@user.tmi.twitch.tv JOIN #channel")
+        self.assertEqual((message.nick, message.channel, message.trailing), ("user", "channel", None))
+
+    def test_server_messages(self):
+        message = parse(":tmi.twitch.tv 001 bot :Welcome, GLHF!")
+        self.assertEqual((message.command, message.params, message.trailing), ("001", ["bot"], "Welcome, GLHF!"))
+        self.assertIsNone(message.nick)
+        self.assertIsNone(message.channel)
+        message = parse(":tmi.twitch.tv CAP * ACK :twitch.tv/tags twitch.tv/commands")
+        self.assertEqual(message.params, ["*", "ACK"])
+
+    def test_empty_trailing_and_clearchat(self):
+        self.assertEqual(parse(":user!user@user.tmi.twitch.tv PRIVMSG #channel :").trailing, "")
+        message = parse("@ban-duration=600;target-user-id=1 :tmi.twitch.tv CLEARCHAT #channel :baduser")
+        self.assertEqual((message.tags.get("ban-duration"), message.trailing), ("600", "baduser"))
+        self.assertEqual(str(message), message.raw)
+
+    def test_invalid_lines(self):
+        self.assertIsNone(parse(""))
+        self.assertIsNone(parse(" "))
+        # tags or a prefix without a command
+        self.assertIsNone(parse("@badge-info= "))
+        self.assertIsNone(parse(":tmi.twitch.tv "))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+from twitchchat.ratelimit import TokenBucket, SendScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenBucketTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.bucket = TokenBucket(2, 30, self.clock)
+
+    def test_full_burst_then_wait_for_the_first_refill(self):
+        self.assertTrue(self.bucket.consume())
+        self.clock.now += 10
+        self.assertTrue(self.bucket.consume())
+        self.assertFalse(self.bucket.consume())
+        self.assertEqual(self.bucket.delay(), 20)
+        self.clock.now += 20
+        self.assertEqual(self.bucket.delay(), 0)
+        self.assertTrue(self.bucket.consume())
+        self.assertFalse(self.bucket.consume())
+
+
+class StaleDelayBucket(TokenBucket):
+    """delay() says a token is free, like a check another connection raced past before consume"""
+
+    def delay(self) -> float:
+        return 0.0
+
+
+class SendSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.bucket = TokenBucket(20, 30, self.clock)
+        self.scheduler = SendScheduler(self.bucket, 1, 1)
+
+    def test_lines_without_a_channel_are_not_limited(self):
+        self.scheduler.push("PRIVMSG #a :hi\r\n", "a")
+        self.scheduler.push("PONG :tmi.twitch.tv\r\n")
+        self.assertEqual(self.scheduler.pop(), ("PONG :tmi.twitch.tv\r\n", None))
+        self.assertEqual(self.scheduler.pop(), ("PRIVMSG #a :hi\r\n", None))
+        self.assertEqual(self.scheduler.pop(), (None, None))
+
+    def test_limited_channel_waits_while_others_send(self):
+        self.scheduler.push("PRIVMSG #a :1\r\n", "a")
+        self.scheduler.push("PRIVMSG #a :2\r\n", "a")
+        self.scheduler.push("PRIVMSG #b :1\r\n", "b")
+        self.assertEqual(self.scheduler.pop(), ("PRIVMSG #a :1\r\n", None))
+        self.assertEqual(self.scheduler.pop(), ("PRIVMSG #b :1\r\n", None))
+        self.assertEqual(self.scheduler.pop(), (None, 1))
+        self.clock.now += 1
+        self.assertEqual(self.scheduler.pop(), ("PRIVMSG #a :2\r\n", None))
+
+    def test_lowest_priority_goes_first_then_queue_order(self):
+        self.scheduler.push("spam\r\n", "a", 3)
+        self.scheduler.push("command 1\r\n", "a", 1)
+        self.scheduler.push("command 2\r\n", "a", 1)
+        self.scheduler.push("chat\r\n", "a", 0)
+        sent = []
+        while len(self.scheduler) != 0:
+            line, delay = self.scheduler.pop()
+            if line is None:
+                self.clock.now += delay
+            else:
+                sent.append(line)
+        self.assertEqual(sent, ["chat\r\n", "command 1\r\n", "command 2\r\n", "spam\r\n"])
+
+    def test_priority_is_compared_between_channels(self):
+        self.scheduler.push("spam\r\n", "a", 3)
+        self.scheduler.push("chat\r\n", "b", 0)
+        self.assertEqual(self.scheduler.pop(), ("chat\r\n", None))
+
+    def test_stale_lines_are_dropped(self):
+        self.scheduler.push("first\r\n", "a")
+        self.scheduler.push("spam\r\n", "a", 3, 10)
+        self.scheduler.push("command\r\n", "a", 1)
+        self.assertEqual(self.scheduler.pop(), ("first\r\n", None))
+        self.clock.now += 11
+        self.assertEqual(self.scheduler.pop(), ("command\r\n", None))
+        self.clock.now += 1
+        self.assertEqual(self.scheduler.pop(), (None, None))
+        self.assertEqual(len(self.scheduler), 0)
+
+    def test_only_stale_lines_left(self):
+        self.scheduler.push("spam\r\n", "a", 3, 10)
+        self.clock.now += 11
+        self.assertEqual(self.scheduler.pop(), (None, None))
+
+    def test_connections_sharing_a_bucket_stay_under_its_limit(self):
+        bucket = StaleDelayBucket(1, 30, self.clock)
+        first, second = SendScheduler(bucket, 1, 1), SendScheduler(bucket, 1, 1)
+        first.push("PRIVMSG #a :1\r\n", "a")
+        second.push("PRIVMSG #b :1\r\n", "b")
+        self.assertEqual(first.pop(), ("PRIVMSG #a :1\r\n", None))
+        self.assertIsNone(second.pop()[0])
+        self.assertEqual(len(second), 1)
+        self.clock.now += 30
+        self.assertEqual(second.pop(), ("PRIVMSG #b :1\r\n", None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import random
+import unittest
+from utility.classes import StreakTable
+
+
+def update_all(streaks, emotes):
+    """The update StreakTable replaces, every emote the channel ever had is touched for every message"""
+    for emote in emotes:
+        if emote not in streaks:
+            streaks[emote] = {"current": "0", "max": "0"}
+    for emote, streak in streaks.items():
+        if emote in emotes:
+            streak["current"] = str(int(streak.get("current")) + 1)
+        elif int(streak["current"]) > int(streak["max"]):
+            streak["max"] = streak["current"]
+            streak["current"] = "0"
+        else:
+            streak["current"] = "0"
+
+
+def top_all(streaks, amount):
+    ranking = [(emote, int(streak["max"])) for emote, streak in streaks.items()]
+    ranking.sort(key=lambda tup: tup[1], reverse=True)
+    return ranking[:amount]
+
+
+class StreakTableTest(unittest.TestCase):
+    def test_same_streaks_as_updating_every_emote(self):
+        rnd = random.Random(3)
+        emotes = ["Kappa", "PogChamp", "LUL", "pepeLaugh", "OMEGALUL", "monkaS", "KEKW"]
+        expected = {}
+        table = StreakTable()
+        for i in range(3000):
+            message = set(rnd.sample(emotes, rnd.randint(0, 3)))
+            update_all(expected, message)
+            table.update(message)
+            if i % 500 == 499:
+                emote = rnd.choice(emotes)
+                expected.get(emote, {})["max"] = "0"
+                table.reset(emote)
+            if i % 250 == 0:
+                self.assertEqual(table.to_dict(), expected)
+                self.assertEqual(table.top(3), top_all(expected, 3))
+                # a table loaded from the saved streaks goes on where this one is
+                table = StreakTable(table.to_dict())
+        self.assertEqual(table.to_dict(), expected)
+        self.assertEqual(table.top(len(emotes)), top_all(expected, len(emotes)))
+
+    def test_current_and_max(self):
+        table = StreakTable({"Kappa": {"current": "2", "max": "5"}})
+        table.update({"Kappa", "LUL"})
+        self.assertEqual(table.get("Kappa"), {"current": "3", "max": "5"})
+        self.assertEqual(table.get("LUL"), {"current": "1", "max": "0"})
+        table.update(set())
+        self.assertEqual(table.get("LUL"), {"current": "0", "max": "1"})
+        self.assertIsNone(table.get("PogChamp"))
+        self.assertNotIn("PogChamp", table)
+        self.assertEqual(table.top(1), [("Kappa", 5)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+"""
+    Recording of raw irc traffic.
+    A capture is a gzip compressed text file with one received line per row, prefixed by the time it was received.
+    benchmarks/replay.py feeds captures back through TwitchChat.handle_message.
+"""
+import gzip
+import time
+from threading import Lock
+
+
+class Recorder:
+    def __init__(self, fp: str):
+        self.fp = fp
+        self.count = 0
+        self._fh = gzip.open(fp, "wt", encoding="utf-8")
+        self._lock = Lock()
+
+    def record(self, line: str):
+        with self._lock:
+            if self._fh is None:
+                return
+            self._fh.write("{0:.3f} {1}\n".format(time.time(), line))
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+
+def read_capture(fp: str):
+    """Yields (timestamp, line) for every line in the capture"""
+    with gzip.open(fp, "rt", encoding="utf-8") as fh:
+        for row in fh:
+            ts, _, line = row.rstrip("\n").partition(" ")
+            yield float(ts), line
@@ -1,32 +1,58 @@
-from localasync import asynchat, asyncore
 import logging
-import socket
 from utility import *
 from utility import rbac
 import re
 import commands
-from datetime import datetime, timedelta
-from threading import Thread
-from queue import Queue
+from threading import Thread, Lock
 import importlib
+import os
+from .capture import Recorder
+from .joins import JoinPipeline
+from .pool import ConnectionPool
+from .parser import parse, ParsedMessage
+from .workers import ChannelWorkerPool
 
 logger = logging.getLogger(name="tmi")
 
+COMMAND_REGEX = re.compile(r"!([^\s]*).*", re.UNICODE)
+COMMAND_WORKERS = 8
+CHANNELS_PER_CONNECTION = 50
+STATE_FILE = "texts/global_state.txt"
+# seconds stop_all waits for the saves that are still running
+SHUTDOWN_SAVE_TIMEOUT = 30
+# irc commands whose handlers run commands.py functions, these are handled on the worker pool instead of the irc loop
+WORKER_COMMANDS = {"PRIVMSG", "CLEARCHAT", "USERNOTICE"}
+
 
 class TwitchChat(object):
 
-    def __init__(self, user, admin, oauth, channels):
+    def __init__(self, user, admin, oauth, channels, twitch_status=None, interactive=True,
+                 server='irc.chat.twitch.tv:6667', state_file=STATE_FILE, journal=None):
+        """
+        :param state_file: file the state is loaded from and saved to
+        :param journal: Journal for the state and the stores of commands, commands.journal (texts/journal.txt) if None
+        """
         self.logger = logging.getLogger(name="twitch_chat")
         self.channels = channels
         self.admin = admin
         self.user = user
         self.oauth = oauth
-        self.server = 'irc.chat.twitch.tv:6667'
-        self.irc_client = IrcClient(self.server, self.handle_message)
-
-        self.state = f.load("texts/global_state.txt", default=dict())
+        self.server = server
+        self.connections = ConnectionPool(self.server, self.handle_message, self.on_connect, CHANNELS_PER_CONNECTION)
+
+        self.state_file = state_file
+        self.journal = journal if journal is not None else commands.journal
+        if self.journal is not commands.journal:
+            commands.use_journal(self.journal)
+        # TrackedDict so save can tell whether the state changed, its changes are journaled like the stores of commands
+        self.state = TrackedDict(f.load(self.state_file, default=dict()), journal=self.journal, name="state")
+        # the handlers of different channels run at the same time, counters in the state are updated under this lock
+        self.state_lock = Lock()
         self.limiter = MessageLimiter()
-        self.twitch_status = TwitchStatus(user, channels, commands.ID_cache)
+        self.persister = Persister()
+        self.persister.start()
+        self.twitch_status = twitch_status if twitch_status is not None else TwitchStatus(user, channels,
+                                                                                          commands.ID_cache)
 
         self.admins = commands.ADMIN
         self.command = commands.COMMAND
@@ -38,18 +64,38 @@ class TwitchChat(object):
                                 commands.REPEAT.items()}
         for func_name, setup_func in commands.REPEAT_SETUP.items():
             self.repeating_tasks.get(func_name).setup(setup_func)
+        # irc command -> handler, every incoming line is parsed once and dispatched through this table
+        self.handlers = {
+            "PRIVMSG": self.check_message,
+            "JOIN": self.check_join,
+            "PART": self.check_part,
+            "CLEARCHAT": self.check_clearchat,
+            "USERNOTICE": self.check_usernotice,
+            "PING": self.check_ping,
+            "NOTICE": self.check_error,
+        }
+        self.workers = ChannelWorkerPool(COMMAND_WORKERS)
+        self.joins = JoinPipeline()
 
         self.active = True
-        self.command_thread = Thread(target=self.handle_commandline_input)
-        self.command_thread.daemon = True
-        self.command_thread.start()
-        self.backup_t = Thread(target=self.backup_thread)
-        self.backup_t.daemon = True
-        self.backup_t.start()
-
-    def init_caps(self):
+        if interactive:
+            self.command_thread = Thread(target=self.handle_commandline_input)
+            self.command_thread.daemon = True
+            self.command_thread.start()
+            self.backup_t = Thread(target=self.backup_thread)
+            self.backup_t.daemon = True
+            self.backup_t.start()
+
+    def on_connect(self, client):
+        """Called on the irc event loop once the connection is established"""
+        # init twitch
+        self.init_caps(client)
+
+        # Joining the channels assigned to this connection
+        self.joins.request(self.connections.channels_of(client), client)
+
+    def init_caps(self, client):
         self.logger.info('Connected..authenticating as {0}'.format(self.user))
-        client = self.irc_client
         client.send_message('Pass ' + self.oauth + '\r\n')
         client.send_message('NICK ' + self.user.lower() + '\r\n')
         client.send_message('CAP REQ :twitch.tv/tags\r\n')
@@ -57,13 +103,18 @@ class TwitchChat(object):
         client.send_message('CAP REQ :twitch.tv/commands\r\n')
 
     def save(self):
-        f.save(self.state, "texts/global_state.txt")
+        """Queues all saves on the persister and returns right away"""
+        self.persister.submit("save_state", lambda: self.state.save(
+            lambda state, kwargs: f.save(state, self.state_file)))
         for name, func in self.saves.items():
-            logger.info(f"Calling {name}")
-            func()
+            self.persister.submit(name, func)
+        # after the saves, everything they saved can go from the journal
+        self.persister.submit("compact_journal", self.journal.compact)
 
     def reload(self):
+        commands.lack_stats.stop()
         importlib.reload(commands)
+        commands.lack_stats.start()
         self.admins = commands.ADMIN
         self.command = commands.COMMAND
         self.clearchat = commands.CLEARCHAT
@@ -80,52 +131,65 @@ class TwitchChat(object):
             repeating_task.start()
 
     def start(self):
-        self.irc_client.start()
+        self.workers.start()
+        self.joins.start()
+        commands.lack_stats.start()
+        # Assigning channels to connections, every connection joins its channels once it's connected
+        self.join_twitch_channels(list(self.channels))
+        self.connections.start()
         for repeating_task in self.repeating_tasks.values():
             repeating_task.start()
 
-        # wait till irc is connected
-        while not self.irc_client.connected:
-            pass
-
-        # init twitch
-        self.init_caps()
-
-        # Joining channels
-        self.logger.info("Joining channels: {0}".format(self.channels))
-        for chan in self.channels:
-            self.join_twitch_channel(chan)
-
     def join(self):
-        self.irc_client.asynloop_thread.join()
+        self.connections.join()
 
     def stop_all(self):
         self.active = False
-        self.irc_client.stop()
+        self.connections.stop()
+        self.workers.stop()
+        self.joins.stop()
+        commands.lack_stats.stop()
         for task in self.repeating_tasks.values():
             task.stop()
+        self.persister.stop(SHUTDOWN_SAVE_TIMEOUT)
+        self.journal.close()
 
     def join_twitch_channel(self, channel: str):
-        self.state[channel] = self.state.get(channel, dict())
-        # Turn bot off when joining a channel (except for functional and chat messages)
-        # if it doesn't have a state yet for that channel.
-        if len(self.state[channel]) == 0:
-            self.toggle_channel(channel, ToggleType.OFF)
-        self.logger.info('Joining channel {0}'.format(channel))
-        channels = self.channels
-        if channel not in channels:
-            channels.append(channel)
-        self.channels = channels
-        client = self.irc_client
-        client.send_message("JOIN #" + channel.lower() + "\r\n")
+        self.join_twitch_channels([channel])
+
+    def join_twitch_channels(self, channels_to_join: list):
+        """Joins all channels through the join pipeline, connections that aren't connected yet join on connect"""
+        to_request = {}
+        for channel in channels_to_join:
+            self.state[channel] = self.state.get(channel, dict())
+            # Turn bot off when joining a channel (except for functional and chat messages)
+            # if it doesn't have a state yet for that channel.
+            if len(self.state[channel]) == 0:
+                self.toggle_channel(channel, ToggleType.OFF)
+            self.logger.info('Joining channel {0}'.format(channel))
+            channels = self.channels
+            if channel not in channels:
+                channels.append(channel)
+            self.channels = channels
+            client = self.connections.assign(channel.lower())
+            if client.connected:
+                to_request[client] = to_request.get(client, [])
+                to_request[client].append(channel.lower())
+        for client, channels in to_request.items():
+            self.joins.request(channels, client)
 
     def leave_twitch_channel(self, channel: str):
         self.logger.info('Leaving channel {0}'.format(channel))
-        client = self.irc_client
-        client.send_message("PART #" + channel.lower() + "\r\n")
+        client = self.connections.release(channel.lower())
+        if client is not None:
+            self.joins.part([channel.lower()], client)
         channels = self.channels
         updated_channels = [chan for chan in channels if chan != channel]
         self.channels = updated_channels
+        # Moves the channels of a connection that's no longer needed to the others
+        for moved, old_client, new_client in self.connections.rebalance():
+            if new_client.connected:
+                self.joins.request([moved], new_client)
 
     def toggle_channel(self, channel, toggle_type: ToggleType):
         if toggle_type == ToggleType.ON:
@@ -143,9 +207,12 @@ class TwitchChat(object):
         message = commands.filter_message(message, self)
         if self.can_send_type(message.channel, message.type) and count_capitals(message.content) < 50:
             if not commands.ignore_list.access(contains, elem=message.user) or message.user.lower() in commands.war:
-                self.state[message.channel]["messages"] = str(int(self.state[message.channel].get("messages", "0")) + 1)
-                client = self.irc_client
-                client.send_message(u'PRIVMSG #{0} :{1}\n'.format(message.channel, message.content))
+                with self.state_lock:
+                    self.state[message.channel]["messages"] = str(
+                        int(self.state[message.channel].get("messages", "0")) + 1)
+                self.connections.send_message(u'PRIVMSG #{0} :{1}\n'.format(message.channel, message.content),
+                                              message.channel, MESSAGE_PRIORITY.get(message.type),
+                                              MESSAGE_MAX_AGE.get(message.type))
 
     def can_send_type(self, channel, msg_type: MessageType):
         return convert(self.state.get(channel).get(msg_type.name, "True"))
@@ -153,133 +220,97 @@ class TwitchChat(object):
     def handle_message(self, irc_message, client):
         """Handle incoming IRC messages"""
         self.logger.debug(irc_message)
-        if self.check_message(irc_message):
-            return
-        elif self.check_join(irc_message):
-            return
-        elif self.check_part(irc_message):
-            return
-        elif self.check_clearchat(irc_message):
-            return
-        elif self.check_usernotice(irc_message):
+        message = parse(irc_message)
+        if message is None:
             return
-        elif self.check_ping(irc_message, client):
-            return
-        elif self.check_error(irc_message):
+        handler = self.handlers.get(message.command)
+        if handler is None:
             return
+        if message.command in WORKER_COMMANDS and message.channel is not None:
+            # keep slow commands from blocking the socket, messages of one channel still get handled in order
+            self.workers.submit(message.channel, handler, message, client)
+        else:
+            handler(message, client)
 
-    def check_error(self, irc_message):
+    def check_error(self, message: ParsedMessage, client):
         """Check for a login error notification and terminate if found"""
-        if re.search(r":tmi.twitch.tv NOTICE \* :Error logging i.*", irc_message):
+        if message.trailing is not None and message.trailing.startswith("Error logging i"):
             self.logger.critical(
                 "Error logging in to twitch irc, check your oauth and username are set correctly in config.txt!")
             self.stop_all()
-            return True
 
-    def check_join(self, irc_message):
+    def check_join(self, message: ParsedMessage, client):
         """Watch for successful channel join messages"""
-        match = re.search(r':{0}!{0}@{0}\.tmi\.twitch\.tv JOIN #(.*)'.format(self.user), irc_message)
-        if match:
-            if match.group(1) in self.channels:
-                self.logger.info("Joined channel {0} successfully".format(match.group(1)))
-                return True
+        # twitch echoes the lower cased nick that init_caps sends
+        if message.nick == self.user.lower() and self.joins.confirm(message.channel):
+            self.logger.info("Joined channel {0} successfully".format(message.channel))
 
-    def check_part(self, irc_message):
-        """Watch for successful channel join messages"""
-        match = re.search(r':{0}!{0}@{0}\.tmi\.twitch\.tv PART #(.*)'.format(self.user), irc_message)
-        if match:
-            self.logger.info("Left channel {0} successfully".format(match.group(1)))
-            return True
+    def check_part(self, message: ParsedMessage, client):
+        """Watch for successful channel part messages"""
+        if message.nick == self.user.lower():
+            self.logger.info("Left channel {0} successfully".format(message.channel))
 
-    def check_usernotice(self, irc_message):
+    def check_usernotice(self, message: ParsedMessage, client):
         """Parse out new twitch subscriber messages and then call... python subscribers"""
-        if irc_message[0] == '@':
-            arg_regx = r"([^=;]*)=([^ ;]*)"
-            arg_regx = re.compile(arg_regx, re.UNICODE)
-            args = dict(re.findall(arg_regx, irc_message[1:]))
-            regex = (
-                r'^@[^ ]* :tmi.twitch.tv'
-                r' USERNOTICE #(?P<channel>[^ ]*)'  # channel
-                r'((?: :)?(?P<message>.*))?')  # message
-            regex = re.compile(regex, re.UNICODE)
-            match = re.search(regex, irc_message)
-            if match:
-                args['channel'] = match.group(1)
-                args['message'] = match.group(2)
-                for func_name, func in self.notice.items():
-                    func(self, args)
-                return True
-
-    def check_clearchat(self, irc_message):
-        if irc_message[0] == '@':
-            arg_regx = r"([^=;]*)=([^ ;]*)"
-            arg_regx = re.compile(arg_regx, re.UNICODE)
-            args = dict(re.findall(arg_regx, irc_message[1:]))
-            regex = (
-                r'^@[^ ]* :tmi.twitch.tv'
-                r' CLEARCHAT #(?P<channel>[^ ]*)'  # channel
-                r'((?: :)?(?P<message>.*))?')  # message
-            regex = re.compile(regex, re.UNICODE)
-            match = re.search(regex, irc_message)
-            if match:
-                args['channel'] = match.group(1)
-                args['message'] = match.group(2)
-                for func_name, func in self.clearchat.items():
-                    func(self, args)
-                return True
+        args = message.to_args()
+        for func_name, func in self.notice.items():
+            func(self, args)
+
+    def check_clearchat(self, message: ParsedMessage, client):
+        args = message.to_args()
+        for func_name, func in self.clearchat.items():
+            func(self, args)
 
     @staticmethod
-    def check_ping(irc_message, client):
+    def check_ping(message: ParsedMessage, client):
         """Respond to ping messages or twitch boots us off"""
-        if re.search(r"PING :tmi\.twitch\.tv", irc_message):
-            message = "PING :pong\r\n"
-            client.send_message(message)
-            return True
+        client.send_message("PONG :{0}\r\n".format(message.trailing))
 
-    def check_message(self, irc_message):
+    def check_message(self, message: ParsedMessage, client):
         """Watch for chat messages and notifiy subsribers"""
-        if irc_message[0] == "@":
-            arg_regx = r"([^=;]*)=([^ ;]*)"
-            arg_regx = re.compile(arg_regx, re.UNICODE)
-            args = dict(re.findall(arg_regx, irc_message[1:]))
-            regex = (r'^@[^ ]* :([^!]*)![^!]*@[^.]*.tmi.twitch.tv'  # username
-                     r' PRIVMSG #([^ ]*)'  # channel
-                     r' :(.*)')  # message
-            regex = re.compile(regex, re.UNICODE)
-            match = re.search(regex, irc_message)
-            if match:
-                args['username'] = match.group(1)
-                args['channel'] = match.group(2)
-                args['message'] = match.group(3)
-                self.logger.debug(args["message"])
-                # ADMIN
-                if args["username"] in self.admin:
-                    for func_name, func in self.admins.items():
-                        func(self, args)
-                # ROLES
-                if rbac.has_roles(args['username'], args['channel']):
-                    funcs = rbac.get_allowed_functions(args['username'], args['channel'])
-                    for func in funcs:
-                        if func(self, args):
-                            return True
-
-                # COMMANDS
-                if len(match.group(3)) > 0 and match.group(3)[0] == "!":
-                    command = re.match(r"!([^\s]*).*", match.group(3).lower())
-                    if command:
-                        command_name = command.group(1)
-                        if command_name in self.commands and self.limiter.can_send(args["channel"], "command", 3):
-                            self.commands.get(command_name)(self, args)
-                        elif commands.commands.access(contains, elem=command_name):
-                            response = commands.commands.access(get_val, key=command_name)
-                            self.send_message(Message(response, MessageType.COMMAND, args["channel"], args["username"]))
-
-                    return True
-
-                # ALWAYS
-                for func_name, func in self.command.items():
-                    func(self, args)
-                return True
+        if message.channel is None or message.trailing is None:
+            return
+        args = message.to_args()
+        self.logger.debug(args["message"])
+        # ADMIN
+        if args["username"] in self.admin:
+            for func_name, func in self.admins.items():
+                func(self, args)
+        # ROLES
+        if rbac.has_roles(args['username'], args['channel']):
+            funcs = rbac.get_allowed_functions(args['username'], args['channel'])
+            for func in funcs:
+                if func(self, args):
+                    return
+
+        # COMMANDS
+        if args["message"][:1] == "!":
+            command = COMMAND_REGEX.match(args["message"].lower())
+            if command:
+                command_name = command.group(1)
+                if command_name in self.commands and self.limiter.can_send(args["channel"], "command", 3):
+                    self.commands.get(command_name)(self, args)
+                elif commands.commands.access(contains, elem=command_name):
+                    response = commands.commands.access(get_val, key=command_name)
+                    self.send_message(Message(response, MessageType.COMMAND, args["channel"], args["username"]))
+            return
+
+        # ALWAYS
+        for func_name, func in self.command.items():
+            func(self, args)
+
+    def toggle_recording(self):
+        """Starts recording all received lines to captures/, stops the recording if one is running"""
+        recorder = self.connections.recorder
+        if recorder is None:
+            os.makedirs("captures", exist_ok=True)
+            recorder = Recorder(time.strftime("captures/%Y%m%d-%H%M%S.txt.gz"))
+            self.connections.set_recorder(recorder)
+            print("Recording to {0}".format(recorder.fp))
+        else:
+            self.connections.set_recorder(None)
+            recorder.close()
+            print("Recorded {0} lines to {1}".format(recorder.count, recorder.fp))
 
     def backup_thread(self):
         while self.active:
@@ -314,6 +345,17 @@ class TwitchChat(object):
                 print(self.state)
             elif ans == "db":
                 print(commands.db)
+            elif ans == "joins":
+                print(self.joins.status())
+            elif ans == "record":
+                self.toggle_recording()
+            elif ans == "lacks":
+                print("{0} lack counts waiting, last flush: {1}".format(commands.lack_stats.pending(),
+                                                                         commands.lack_stats.last_flush))
+            elif ans == "cache":
+                info = commands.lack_of.cache_info()
+                lookups = info.hits + info.misses
+                print("{0}, hit ratio {1:.1%}".format(info, info.hits / lookups if lookups != 0 else 0))
             elif match:
                 print("channel?")
                 ans = input()
@@ -321,105 +363,4 @@ class TwitchChat(object):
                     msg = Message(match.group(1), MessageType.CHAT, ans, self.user)
                     self.send_message(msg)
             else:
-                print("save\nstop\njoin\nleave\nreload\nstate\ndb\nsend (msg)")
-
-
-MAX_SEND_RATE = 20
-SEND_RATE_WITHIN_SECONDS = 30
-
-
-class IrcClient(asynchat.async_chat, object):
-
-    def __init__(self, server, message_callback):
-        self.logger = logging.getLogger(name="tmi_client[{0}]".format(server))
-        self.logger.info('TMI initializing')
-        self.map = {}
-        asynchat.async_chat.__init__(self, map=self.map)
-        self.received_data = bytearray()
-        servernport = server.split(":")
-        self.server = servernport[0]
-        self.port = int(servernport[1])
-        self.set_terminator(b'\n')
-        self.asynloop_thread = Thread(target=self.run)
-        self.send_thread = Thread(target=self.send_loop)
-        self.send_thread.daemon = True
-        self.running = False
-        self.message_callback = message_callback
-        self.connected = False
-        self.message_queue = Queue()
-        self.messages_sent = []
-        self.logger.info('TMI initialized')
-        return
-
-    def send_message(self, msg: str):
-        self.message_queue.put(msg)
-
-    def handle_connect(self):
-        """Socket connected successfully"""
-        self.connected = True
-
-    def handle_error(self):
-        if self.socket:
-            self.close()
-        raise
-
-    def collect_incoming_data(self, data):
-        """Dump recieved data into a buffer"""
-        self.received_data += data
-
-    def found_terminator(self):
-        """Processes each line of text received from the IRC server."""
-        txt = self.received_data.rstrip(b'\r')  # accept RFC-compliant and non-RFC-compliant lines.
-        del self.received_data[:]
-        self.message_callback(txt.decode("utf-8"), self)
-
-    def start(self):
-        """Connect start message watching thread"""
-        if not self.asynloop_thread.is_alive():
-            self.running = True
-            self.asynloop_thread = Thread(target=self.run)
-            self.asynloop_thread.daemon = True
-            self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.connect((self.server, self.port))
-            self.asynloop_thread.start()
-
-            self.send_thread.start()
-
-        else:
-            self.logger.critical("Already running can't run twice")
-
-    def stop(self):
-        """Terminate the message watching thread by killing the socket"""
-        self.running = False
-        if self.asynloop_thread.is_alive():
-            if self.socket:
-                self.close()
-            try:
-                self.asynloop_thread.join()
-                self.send_thread.join()
-            except RuntimeError as e:
-                if str(e) == "cannot join current thread":
-                    # this is thrown when joining the current thread and is ok.. for now"
-                    pass
-                else:
-                    raise e
-
-    def send_loop(self):
-        while self.running:
-            if len(self.messages_sent) < MAX_SEND_RATE:
-                if not self.message_queue.empty():
-                    to_send = self.message_queue.get()
-                    self.push(to_send.encode("UTF-8"))
-                    self.logger.info(to_send)
-                    self.messages_sent.append(datetime.now())
-                    time.sleep(random.randint(50, 150) / 100)
-            else:
-                time_cutoff = datetime.now() - timedelta(seconds=SEND_RATE_WITHIN_SECONDS)
-                self.messages_sent = [dt for dt in self.messages_sent if dt < time_cutoff]
-
-    def run(self):
-        """Loop!"""
-        try:
-            asyncore.loop(map=self.map)
-        finally:
-            self.running = False
+                print("save\nstop\njoin\nleave\nreload\nstate\ndb\njoins\nrecord\ncache\nlacks\nsend (msg)")
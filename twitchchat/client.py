@@ -0,0 +1,153 @@
+import asyncio
+import logging
+from threading import Thread
+from .framing import LineFramer
+from .ratelimit import TokenBucket, SendScheduler
+
+MAX_SEND_RATE = 20
+SEND_RATE_WITHIN_SECONDS = 30
+MAX_CHANNEL_SEND_RATE = 1
+CHANNEL_SEND_RATE_WITHIN_SECONDS = 1
+READ_SIZE = 65536
+
+
+class IrcClient(object):
+    """
+        asyncio streams based irc connection.
+        Reading, writing and send pacing all run as tasks on one event loop that lives in loop_thread.
+        message_callback(line, client) is called for every line received,
+        connect_callback(client) once the connection is established.
+    """
+
+    def __init__(self, server, message_callback, connect_callback=None, bucket=None):
+        self.logger = logging.getLogger(name="tmi_client[{0}]".format(server))
+        self.logger.info('TMI initializing')
+        servernport = server.split(":")
+        self.server = servernport[0]
+        self.port = int(servernport[1])
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = Thread(target=self.run)
+        self.running = False
+        self.connected = False
+        self.message_callback = message_callback
+        self.connect_callback = connect_callback
+        # global send limit, pass the same bucket to connections that share an account
+        bucket = bucket if bucket is not None else TokenBucket(MAX_SEND_RATE, SEND_RATE_WITHIN_SECONDS)
+        self.scheduler = SendScheduler(bucket, MAX_CHANNEL_SEND_RATE, CHANNEL_SEND_RATE_WITHIN_SECONDS)
+        # made by connection, an asyncio.Event belongs to the loop it's first used on and start makes a new loop
+        self._wakeup = None
+        self._writer = None
+        # twitchchat.capture.Recorder that gets every received line when set
+        self.recorder = None
+        self.logger.info('TMI initialized')
+
+    def send_message(self, msg: str, channel=None, priority=0, max_age=None):
+        """
+            Thread safe, queues msg to be sent on the event loop.
+        :param msg: raw irc line
+        :param channel: channel the line is sent to, lines with a channel count against the send rate limits
+        :param priority: lower priorities are sent first when rate limited
+        :param max_age: seconds after which the line gets dropped if it still hasn't been sent
+        """
+        if self.loop.is_closed():
+            self.logger.warning("Connection is closed, dropping {0}".format(msg.rstrip()))
+            return
+        self.loop.call_soon_threadsafe(self._enqueue, msg, channel, priority, max_age)
+
+    def _enqueue(self, msg, channel, priority, max_age):
+        self.scheduler.push(msg, channel, priority, max_age)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self):
+        """Connect and start the event loop thread"""
+        if not self.loop_thread.is_alive():
+            if self.loop.is_closed():
+                self.loop = asyncio.new_event_loop()
+            self.running = True
+            self.loop_thread = Thread(target=self.run)
+            self.loop_thread.daemon = True
+            self.loop_thread.start()
+        else:
+            self.logger.critical("Already running can't run twice")
+
+    def stop(self):
+        """Terminate the event loop thread by closing the connection"""
+        self.running = False
+        if self.loop_thread.is_alive():
+            self.loop.call_soon_threadsafe(self._close)
+            try:
+                self.loop_thread.join()
+            except RuntimeError as e:
+                if str(e) == "cannot join current thread":
+                    # this is thrown when joining the current thread and is ok.. for now"
+                    pass
+                else:
+                    raise e
+
+    def _close(self):
+        if self._writer is not None:
+            self._writer.close()
+        for task in asyncio.all_tasks(self.loop):
+            task.cancel()
+
+    def run(self):
+        """Loop!"""
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.connection())
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            self.logger.exception("Connection failed")
+        finally:
+            self.running = False
+            self.connected = False
+            self._wakeup = None
+            # releases the selector and self-pipe of the loop, start makes a new loop if the client is started again
+            self.loop.close()
+
+    async def connection(self):
+        reader, self._writer = await asyncio.open_connection(self.server, self.port)
+        self._wakeup = asyncio.Event()
+        self.connected = True
+        if self.connect_callback is not None:
+            self.connect_callback(self)
+        sender = self.loop.create_task(self.send_loop())
+        sender.add_done_callback(self._send_loop_done)
+        try:
+            await self.read_loop(reader)
+        finally:
+            sender.cancel()
+            self._writer.close()
+
+    def _send_loop_done(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            self.logger.error("Send loop failed, no more lines will be sent", exc_info=task.exception())
+
+    async def read_loop(self, reader: asyncio.StreamReader):
+        framer = LineFramer()
+        while self.running:
+            data = await reader.read(READ_SIZE)
+            if not data:
+                self.logger.critical("Connection closed by server")
+                break
+            for line in framer.feed(data):
+                if self.recorder is not None:
+                    self.recorder.record(line)
+                self.message_callback(line, self)
+
+    async def send_loop(self):
+        while self.running:
+            to_send, delay = self.scheduler.pop()
+            if to_send is None:
+                # Sleep till something gets queued or till the rate limit allows the next line
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._writer.write(to_send.encode("UTF-8"))
+            await self._writer.drain()
+            self.logger.info(to_send)
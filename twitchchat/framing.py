@@ -0,0 +1,42 @@
+class LineFramer:
+    """
+        Splits the byte stream of a connection into decoded lines.
+        All line boundaries of a received chunk are found in one go and every line is decoded straight from a
+        memoryview slice of that chunk, only a partial line at the end of a chunk gets copied to be completed later.
+    """
+
+    def __init__(self):
+        self._partial = b""
+
+    def feed(self, data: bytes) -> list:
+        """
+            Frames a received chunk.
+        :param data: bytes as received from the socket
+        :return: list of complete lines without their (\\r)\\n terminator
+        """
+        lines = []
+        view = memoryview(data)
+        start = 0
+        end = data.find(b"\n")
+        if len(self._partial) != 0:
+            if end == -1:
+                self._partial += data
+                return lines
+            # complete the line that was cut off by the previous chunk
+            lines.append(self._decode(self._partial + data[:end]))
+            self._partial = b""
+            start = end + 1
+            end = data.find(b"\n", start)
+        while end != -1:
+            # accept RFC-compliant and non-RFC-compliant lines.
+            stop = end - 1 if end > start and data[end - 1] == 13 else end
+            lines.append(str(view[start:stop], "utf-8", "replace"))
+            start = end + 1
+            end = data.find(b"\n", start)
+        if start < len(data):
+            self._partial = bytes(view[start:])
+        return lines
+
+    @staticmethod
+    def _decode(line: bytes) -> str:
+        return line.rstrip(b"\r").decode("utf-8", "replace")
@@ -0,0 +1,131 @@
+import logging
+import time
+from collections import OrderedDict
+from threading import Thread, Condition
+from .ratelimit import TokenBucket
+
+JOIN_RATE = 20
+JOIN_RATE_WITHIN_SECONDS = 10
+JOIN_CONFIRM_TIMEOUT = 15
+JOIN_ATTEMPTS = 3
+# twitch drops irc lines longer than 512 bytes
+MAX_LINE_LENGTH = 500
+
+
+def batch_lines(command: str, channels: list) -> list:
+    """Packs channels into as few "COMMAND #a,#b,#c" lines as fit in MAX_LINE_LENGTH"""
+    lines = []
+    batch = []
+    length = len(command) + 3
+    for channel in channels:
+        if len(batch) != 0 and length + len(channel) + 2 > MAX_LINE_LENGTH:
+            lines.append(command + " " + ",".join(batch) + "\r\n")
+            batch = []
+            length = len(command) + 3
+        batch.append("#" + channel)
+        length += len(channel) + 2
+    if len(batch) != 0:
+        lines.append(command + " " + ",".join(batch) + "\r\n")
+    return lines
+
+
+class JoinPipeline:
+    """
+        Joins channels in bulk while staying under twitch's join rate limit, which is separate from the message limit.
+        Requested channels are sent as comma separated JOINs paced by their own bucket, a channel counts as joined once
+        the JOIN echo for it arrives (confirm). Channels that aren't confirmed within JOIN_CONFIRM_TIMEOUT get retried
+        up to JOIN_ATTEMPTS times.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(name="join_pipeline")
+        self.bucket = TokenBucket(JOIN_RATE, JOIN_RATE_WITHIN_SECONDS)
+        # channel -> (client, attempts), waiting for a join token
+        self.pending = OrderedDict()
+        # channel -> (client, sent at, attempts), JOIN sent but no echo yet
+        self.unconfirmed = {}
+        self.joined = set()
+        self.running = False
+        self._condition = Condition()
+        self.thread = Thread(target=self.run, name="join_pipeline")
+        self.thread.daemon = True
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+
+    def stop(self):
+        with self._condition:
+            self.running = False
+            self._condition.notify()
+
+    def request(self, channels: list, client):
+        """Queues JOINs for channels over client, the client needs to be connected and authenticated"""
+        with self._condition:
+            for channel in channels:
+                self.joined.discard(channel)
+                self.unconfirmed.pop(channel, None)
+                self.pending[channel] = (client, 0)
+            self._condition.notify()
+
+    def part(self, channels: list, client):
+        """Parts channels right away, PARTs aren't rate limited by twitch"""
+        with self._condition:
+            for channel in channels:
+                self.pending.pop(channel, None)
+                self.unconfirmed.pop(channel, None)
+                self.joined.discard(channel)
+        for line in batch_lines("PART", channels):
+            client.send_message(line)
+
+    def confirm(self, channel) -> bool:
+        """Called for every JOIN echo of the bot, returns True if channel was waiting for one"""
+        with self._condition:
+            waiting = self.unconfirmed.pop(channel, None) is not None
+            if waiting:
+                self.joined.add(channel)
+            return waiting
+
+    def status(self) -> dict:
+        with self._condition:
+            return {"pending": list(self.pending.keys()), "unconfirmed": list(self.unconfirmed.keys()),
+                    "joined": len(self.joined)}
+
+    def _retry_unconfirmed(self, now):
+        for channel, (client, sent_at, attempts) in list(self.unconfirmed.items()):
+            if now - sent_at < JOIN_CONFIRM_TIMEOUT:
+                continue
+            self.unconfirmed.pop(channel)
+            if attempts < JOIN_ATTEMPTS:
+                self.logger.warning("No JOIN confirmation for {0}, retrying".format(channel))
+                self.pending[channel] = (client, attempts)
+            else:
+                self.logger.critical("Couldn't join {0} after {1} attempts".format(channel, attempts))
+
+    def _take_batches(self, now) -> dict:
+        batches = {}
+        while len(self.pending) != 0 and self.bucket.consume():
+            channel, (client, attempts) = self.pending.popitem(last=False)
+            batches[client] = batches.get(client, [])
+            batches[client].append(channel)
+            self.unconfirmed[channel] = (client, now, attempts + 1)
+        return batches
+
+    def _next_wakeup(self, now):
+        if len(self.pending) != 0:
+            return self.bucket.delay()
+        if len(self.unconfirmed) != 0:
+            oldest = min(sent_at for client, sent_at, attempts in self.unconfirmed.values())
+            return max(0.0, oldest + JOIN_CONFIRM_TIMEOUT - now)
+        return None
+
+    def run(self):
+        with self._condition:
+            while self.running:
+                now = time.monotonic()
+                self._retry_unconfirmed(now)
+                for client, channels in self._take_batches(now).items():
+                    self.logger.info("Joining channels: {0}".format(channels))
+                    for line in batch_lines("JOIN", channels):
+                        client.send_message(line)
+                self._condition.wait(self._next_wakeup(now))
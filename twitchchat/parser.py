@@ -0,0 +1,76 @@
+"""
+    Single pass tokenizer for the IRCv3 lines twitch sends us.
+
+    Every line is split exactly once into its tags, prefix, command, middle params and trailing param.
+    TwitchChat then dispatches on ParsedMessage.command instead of running every line through a chain of regexes.
+"""
+import re
+
+LINE_REGEX = re.compile(
+    r'^(?:@(?P<tags>[^ ]*) +)?'  # tags
+    r'(?::(?P<prefix>[^ ]+) +)?'  # prefix
+    r'(?P<command>[^ ]+)'  # command
+    r'(?P<params>(?: +[^: ][^ ]*)*)'  # middle params
+    r'(?: +:(?P<trailing>.*))?$',  # trailing param
+    re.UNICODE)
+
+
+class ParsedMessage:
+    def __init__(self, raw: str, tags: dict, prefix, command: str, params: list, trailing):
+        self.raw = raw
+        self.tags = tags
+        self.prefix = prefix
+        self.command = command
+        self.params = params
+        self.trailing = trailing
+
+    @property
+    def nick(self):
+        """Nickname part of the prefix (nick!user@host), None for server messages"""
+        if self.prefix is None or "!" not in self.prefix:
+            return None
+        return self.prefix.split("!", 1)[0]
+
+    @property
+    def channel(self):
+        """Channel the message was sent in without the leading #, None if the first param isn't a channel"""
+        if len(self.params) != 0 and self.params[0][:1] == "#":
+            return self.params[0][1:]
+        return None
+
+    def to_args(self):
+        """
+            Builds the args dictionary the functions in commands.py expect.
+        :return: dict with all tags plus username, channel and message
+        """
+        args = dict(self.tags)
+        args["username"] = self.nick
+        args["channel"] = self.channel
+        args["message"] = self.trailing
+        return args
+
+    def __str__(self):
+        return self.raw
+
+
+def parse_tags(tag_block: str) -> dict:
+    tags = {}
+    for tag in tag_block.split(";"):
+        key, _, val = tag.partition("=")
+        tags[key] = val
+    return tags
+
+
+def parse(line: str):
+    """
+        Tokenizes one irc line.
+    :param line: line without the line terminator
+    :return: ParsedMessage or None if the line isn't valid irc
+    """
+    match = LINE_REGEX.match(line)
+    if match is None:
+        return None
+    tag_block = match.group("tags")
+    tags = parse_tags(tag_block) if tag_block else {}
+    params = match.group("params").split()
+    return ParsedMessage(line, tags, match.group("prefix"), match.group("command"), params, match.group("trailing"))
@@ -0,0 +1,122 @@
+import logging
+from threading import Lock
+from .client import IrcClient, MAX_SEND_RATE, SEND_RATE_WITHIN_SECONDS
+from .ratelimit import TokenBucket
+
+
+class ConnectionPool:
+    """
+        Spreads joined channels over multiple IrcClient connections with at most channels_per_connection each.
+        All connections share the callbacks and the global send bucket, twitch rate limits the account and not
+        the connection.
+    """
+
+    def __init__(self, server, message_callback, connect_callback, channels_per_connection: int):
+        self.logger = logging.getLogger(name="connection_pool")
+        self.server = server
+        self.message_callback = message_callback
+        self.connect_callback = connect_callback
+        self.channels_per_connection = channels_per_connection
+        self.bucket = TokenBucket(MAX_SEND_RATE, SEND_RATE_WITHIN_SECONDS)
+        self.clients = []
+        self.assignments = {}
+        self.running = False
+        self.recorder = None
+        self._lock = Lock()
+
+    def _new_client(self) -> IrcClient:
+        client = IrcClient(self.server, self.message_callback, self.connect_callback, self.bucket)
+        client.recorder = self.recorder
+        self.clients.append(client)
+        self.logger.info("Opening connection {0}".format(len(self.clients)))
+        if self.running:
+            client.start()
+        return client
+
+    def _load(self, client) -> int:
+        return sum(1 for assigned in self.assignments.values() if assigned is client)
+
+    def channels_of(self, client) -> list:
+        with self._lock:
+            return [channel for channel, assigned in self.assignments.items() if assigned is client]
+
+    def client_for(self, channel):
+        return self.assignments.get(channel)
+
+    def assign(self, channel) -> IrcClient:
+        """Returns the connection channel is assigned to, assigns it to the least loaded connection if needed"""
+        with self._lock:
+            if channel in self.assignments:
+                return self.assignments.get(channel)
+            loads = [(self._load(client), client) for client in self.clients]
+            loads = [(load, client) for load, client in loads if load < self.channels_per_connection]
+            client = min(loads, key=lambda tup: tup[0])[1] if len(loads) != 0 else self._new_client()
+            self.assignments[channel] = client
+            return client
+
+    def release(self, channel):
+        """Removes channel from its connection and returns that connection, None if channel wasn't assigned"""
+        with self._lock:
+            return self.assignments.pop(channel, None)
+
+    def rebalance(self) -> list:
+        """
+            Empties and closes the least loaded connection when its channels fit on the other connections.
+        :return: list of (channel, old client, new client) for every channel that moved
+        """
+        moves = []
+        with self._lock:
+            if len(self.clients) < 2:
+                return moves
+            loads = sorted(((self._load(client), client) for client in self.clients), key=lambda tup: tup[0])
+            emptiest_load, emptiest = loads[0]
+            room = sum(self.channels_per_connection - load for load, client in loads[1:])
+            if emptiest_load > room:
+                return moves
+            for channel in [chan for chan, assigned in self.assignments.items() if assigned is emptiest]:
+                load, client = min(((self._load(client), client) for load, client in loads[1:]),
+                                   key=lambda tup: tup[0])
+                self.assignments[channel] = client
+                moves.append((channel, emptiest, client))
+            self.clients.remove(emptiest)
+        self.logger.info("Closing connection, moved channels: {0}".format([move[0] for move in moves]))
+        emptiest.stop()
+        return moves
+
+    def set_recorder(self, recorder):
+        """Records the received lines of every connection with recorder, None stops recording"""
+        self.recorder = recorder
+        for client in list(self.clients):
+            client.recorder = recorder
+
+    def send_message(self, msg: str, channel=None, priority=0, max_age=None):
+        """Sends msg over the connection channel is assigned to, lines without a channel go over every connection"""
+        if channel is None:
+            for client in list(self.clients):
+                client.send_message(msg, channel, priority, max_age)
+            return
+        client = self.assignments.get(channel)
+        if client is None:
+            self.logger.warning("Not connected to {0}, dropping {1}".format(channel, msg.rstrip()))
+            return
+        client.send_message(msg, channel, priority, max_age)
+
+    def start(self):
+        if len(self.clients) == 0:
+            self._new_client()
+        self.running = True
+        for client in list(self.clients):
+            client.start()
+
+    def stop(self):
+        self.running = False
+        for client in list(self.clients):
+            client.stop()
+
+    def join(self):
+        """Blocks until every connection has stopped"""
+        while True:
+            alive = [client for client in list(self.clients) if client.loop_thread.is_alive()]
+            if len(alive) == 0:
+                return
+            alive[0].loop_thread.join()
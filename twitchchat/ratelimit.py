@@ -0,0 +1,128 @@
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from threading import Lock
+
+
+class TokenBucket:
+    """
+        Allows capacity actions within any window of period seconds.
+        Every token that gets spent comes back exactly period seconds later on the monotonic clock, so a full burst
+        can go out at once without ever going over twitch's "capacity per period" limits.
+        Thread safe so one bucket can be shared by multiple connections.
+    """
+
+    def __init__(self, capacity: int, period: float, clock=time.monotonic):
+        self.capacity = capacity
+        self.period = period
+        self.clock = clock
+        self._refills = deque()
+        self._lock = Lock()
+
+    def _refill(self, now):
+        while len(self._refills) != 0 and self._refills[0] <= now:
+            self._refills.popleft()
+
+    def delay(self) -> float:
+        """Seconds until a token is available, 0 if one is available right now"""
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            if len(self._refills) < self.capacity:
+                return 0.0
+            return self._refills[0] - now
+
+    def consume(self) -> bool:
+        """Takes a token if one is available, checking and taking happen under one lock"""
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            if len(self._refills) >= self.capacity:
+                return False
+            self._refills.append(now + self.period)
+            return True
+
+
+class SendScheduler:
+    """
+        Decides which queued line goes out next.
+        Lines without a channel (PASS, NICK, CAP, PONG) aren't rate limited by twitch and are sent first.
+        Chat lines have to get a token from the global bucket and from the bucket of their channel,
+        lines of channels that are still limited wait while other channels keep sending.
+        Between sendable lines the lowest priority wins, ties go to the line that was queued first.
+        Lines with a max_age that waited longer than that are dropped.
+        Not thread safe, only meant to be used from the irc event loop.
+    """
+
+    def __init__(self, bucket: TokenBucket, channel_capacity: int, channel_period: float):
+        self.logger = logging.getLogger(name="send_scheduler")
+        self.bucket = bucket
+        self.channel_capacity = channel_capacity
+        self.channel_period = channel_period
+        self.channel_buckets = {}
+        self.unlimited = deque()
+        self.pending = {}
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self.unlimited) + sum(len(lines) for lines in self.pending.values())
+
+    def channel_bucket(self, channel) -> TokenBucket:
+        if channel not in self.channel_buckets:
+            self.channel_buckets[channel] = TokenBucket(self.channel_capacity, self.channel_period,
+                                                        self.bucket.clock)
+        return self.channel_buckets.get(channel)
+
+    def push(self, line: str, channel=None, priority=0, max_age=None):
+        if channel is None:
+            self.unlimited.append(line)
+        else:
+            expires = None if max_age is None else self.bucket.clock() + max_age
+            self.pending[channel] = self.pending.get(channel, [])
+            heapq.heappush(self.pending[channel], (priority, next(self._seq), expires, line))
+
+    def _drop_expired(self, channel, now):
+        lines = self.pending.get(channel)
+        while len(lines) != 0 and lines[0][2] is not None and lines[0][2] < now:
+            priority, seq, expires, line = heapq.heappop(lines)
+            self.logger.info("Dropping stale message: " + line.rstrip())
+        if len(lines) == 0:
+            self.pending.pop(channel)
+
+    def pop(self):
+        """
+            Takes the next line that may be sent right now.
+        :return: (line, None) if a line can be sent, otherwise (None, seconds until one might be sendable)
+                 where seconds is None if nothing is queued
+        """
+        if len(self.unlimited) != 0:
+            return self.unlimited.popleft(), None
+        now = self.bucket.clock()
+        for channel in list(self.pending.keys()):
+            self._drop_expired(channel, now)
+        if len(self.pending) == 0:
+            return None, None
+        # only a shortcut, other connections can take the last token before this one does
+        delay = self.bucket.delay()
+        if delay > 0:
+            return None, delay
+        best = None
+        for channel, lines in self.pending.items():
+            channel_delay = self.channel_bucket(channel).delay()
+            if channel_delay > 0:
+                delay = channel_delay if delay == 0 else min(delay, channel_delay)
+            elif best is None or lines[0][:2] < self.pending[best][0][:2]:
+                best = channel
+        if best is None:
+            return None, delay
+        if not self.bucket.consume():
+            # another connection got the token first, the line stays queued
+            return None, self.bucket.delay()
+        self.channel_bucket(best).consume()
+        lines = self.pending.get(best)
+        priority, seq, expires, line = heapq.heappop(lines)
+        if len(lines) == 0:
+            self.pending.pop(best)
+        return line, None
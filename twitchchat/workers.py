@@ -0,0 +1,62 @@
+import logging
+from collections import deque
+from queue import Queue
+from threading import Thread, Lock
+
+
+class ChannelWorkerPool:
+    """
+        Runs submitted jobs on a fixed amount of worker threads.
+        Jobs of the same channel run one at a time in the order they were submitted,
+        jobs of different channels run concurrently. A slow job only holds up its own channel.
+    """
+
+    def __init__(self, workers: int):
+        self.logger = logging.getLogger(name="channel_workers")
+        self.pending = {}
+        self._lock = Lock()
+        # channels that have jobs and aren't being worked on by a thread right now
+        self._ready = Queue()
+        self.threads = []
+        for i in range(workers):
+            thread = Thread(target=self.run, name="channel_worker_{0}".format(i))
+            thread.daemon = True
+            self.threads.append(thread)
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        for thread in self.threads:
+            self._ready.put(None)
+
+    def submit(self, channel, func, *args):
+        with self._lock:
+            if channel not in self.pending:
+                self.pending[channel] = deque()
+                self._ready.put(channel)
+            self.pending[channel].append((func, args))
+
+    def backlog(self):
+        """Amount of jobs waiting per channel"""
+        with self._lock:
+            return {channel: len(jobs) for channel, jobs in self.pending.items()}
+
+    def run(self):
+        while True:
+            channel = self._ready.get()
+            if channel is None:
+                return
+            with self._lock:
+                func, args = self.pending.get(channel).popleft()
+            try:
+                func(*args)
+            except Exception:
+                self.logger.exception("Job for channel {0} failed".format(channel))
+            with self._lock:
+                if len(self.pending.get(channel)) == 0:
+                    self.pending.pop(channel)
+                else:
+                    # requeue at the back so busy channels don't starve the others
+                    self._ready.put(channel)
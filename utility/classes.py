@@ -1,15 +1,34 @@
+import bisect
+import copy
+import datetime
+import hashlib
+import logging
+import os
+import pickle
 import random
 from enum import Enum, auto
 import time
 import urllib3
 from urllib.parse import urlencode
-from threading import Thread, Lock
+from collections import OrderedDict, deque
+from threading import Thread, Lock, Event, Condition
 import json
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from credentials.api_credentials import client_id, secret
 from utility import file_loader as f
 from utility import functions
 
 TOGGLEABLE = 3
+# word lists EnglishDictionary reads, the first one that exists is used
+WORD_LISTS = ["/usr/share/hunspell/en_US.dic", "/usr/share/myspell/dicts/en_US.dic", "/usr/share/myspell/en_US.dic",
+              "/usr/share/dict/words"]
+WORD_LIST_CACHE_DIR = ".cache"
+# LackStatsWriter defaults
+LACK_FLUSH_INTERVAL = 60
+LACK_FLUSH_BATCH_SIZE = 1000
+LACK_BUCKET_SECONDS = 600
+JOURNAL_FILE = "texts/journal.txt"
 
 
 class MessageType(Enum):
@@ -26,6 +45,25 @@ class MessageType(Enum):
         return self.name
 
 
+# Lower priorities get sent first when the send budget is used up
+MESSAGE_PRIORITY = {
+    MessageType.FUNCTIONAL: 0,
+    MessageType.CHAT: 0,
+    MessageType.COMMAND: 1,
+    MessageType.HELPFUL: 2,
+    MessageType.SPECIAL: 2,
+    MessageType.SUBSCRIBER: 2,
+    MessageType.SPAM: 3,
+    MessageType.BLACKLISTED: 3,
+}
+
+# Seconds a queued message stays relevant, older ones get dropped instead of sent late
+MESSAGE_MAX_AGE = {
+    MessageType.SPAM: 10,
+    MessageType.BLACKLISTED: 10,
+}
+
+
 class ToggleType(Enum):
     ON = auto()
     OFF = auto()
@@ -58,33 +96,217 @@ class Validation:
         self.correct = correct_ans
 
 
+class EmoteIndex:
+    """
+        Answers "which emote is this word a lack of" without comparing the word to every emote.
+        A word is a lack of an emote when hammington gives 1, which only happens for words of the same length with the
+        same first letter and exactly one other letter different (case insensitive), or when it's an anagram of it.
+        Both are turned into dict lookups: every emote is stored under each of its spellings with one letter after the
+        first replaced by a wildcard, and under its sorted letters. Lookups cost len(word) dict hits no matter how many
+        emotes there are. Positions in the emote list are kept so the first matching emote wins like a linear scan.
+        Emotes can be added and removed while other threads look words up, removing leaves an empty position behind.
+    """
+
+    WILDCARD = "\0"
+
+    def __init__(self, emotes: list):
+        self.emotes = []
+        self.known = set()
+        self.lowered = {}
+        self.substitutions = {}
+        self.anagrams = {}
+        self.lock = Lock()
+        for emote in emotes:
+            self.add(emote)
+
+    def _keys(self, lowered: str) -> list:
+        return [lowered[:i] + self.WILDCARD + lowered[i + 1:] for i in range(1, len(lowered))]
+
+    def add(self, emote: str):
+        with self.lock:
+            position = len(self.emotes)
+            self.emotes.append(emote)
+            self.known.add(emote)
+            lowered = emote.lower()
+            self.lowered[lowered] = self.lowered.get(lowered, [])
+            self.lowered[lowered].append(position)
+            for key in self._keys(lowered):
+                self.substitutions[key] = self.substitutions.get(key, [])
+                self.substitutions[key].append(position)
+            signature = "".join(sorted(lowered))
+            self.anagrams[signature] = self.anagrams.get(signature, [])
+            self.anagrams[signature].append(position)
+
+    @staticmethod
+    def _without(table: dict, key, position):
+        # lists are replaced instead of changed so lookups running at the same time see either version
+        positions = [pos for pos in table.get(key, []) if pos != position]
+        if len(positions) == 0:
+            table.pop(key, None)
+        else:
+            table[key] = positions
+
+    def remove(self, emote: str) -> bool:
+        """Removes one occurrence of emote, returns False if the index doesn't have it"""
+        with self.lock:
+            lowered = emote.lower()
+            positions = [position for position in self.lowered.get(lowered, []) if self.emotes[position] == emote]
+            if len(positions) == 0:
+                return False
+            position = positions[0]
+            self._without(self.lowered, lowered, position)
+            for key in self._keys(lowered):
+                self._without(self.substitutions, key, position)
+            self._without(self.anagrams, "".join(sorted(lowered)), position)
+            self.emotes[position] = None
+            if len(positions) == 1:
+                self.known.discard(emote)
+            return True
+
+    def spellings(self, lowered: str) -> list:
+        """Every emote that's spelled lowered when lower cased"""
+        return [self.emotes[position] for position in self.lowered.get(lowered, [])]
+
+    def __contains__(self, emote):
+        return emote in self.known
+
+    def _positions(self, word: str) -> set:
+        lowered = word.lower()
+        positions = set(self.anagrams.get("".join(sorted(lowered)), []))
+        for key in self._keys(lowered):
+            positions.update(self.substitutions.get(key, []))
+        return positions
+
+    def find(self, word: str):
+        """
+        :param word: cleaned up word from chat
+        :return: the first emote word is a lack of, None if it isn't a lack
+        """
+        positions = self._positions(word)
+        if len(positions) == 0:
+            return None
+        return self.emotes[min(positions)]
+
+    def find_all(self, word: str) -> list:
+        """Every emote word is a lack of, in emote list order"""
+        return [self.emotes[position] for position in sorted(self._positions(word))]
+
+
+class ChannelEmoteIndex:
+    """
+        EmoteIndex of one channel made of the index of the global emotes that every channel shares and a small index of
+        the emotes only that channel has. Results of the global index come first, as if its emotes were listed first.
+    """
+
+    def __init__(self, shared: EmoteIndex, own: EmoteIndex):
+        self.shared = shared
+        self.own = own
+
+    def spellings(self, lowered: str) -> list:
+        return self.shared.spellings(lowered) + self.own.spellings(lowered)
+
+    def __contains__(self, emote):
+        return emote in self.shared or emote in self.own
+
+    def find(self, word: str):
+        emote = self.shared.find(word)
+        return emote if emote is not None else self.own.find(word)
+
+    def find_all(self, word: str) -> list:
+        return self.shared.find_all(word) + self.own.find_all(word)
+
+
+class EnglishDictionary:
+    """
+        Front for an enchant dictionary, checking a word with enchant is slow compared to a lookup.
+        Words from the word list and the custom words are looked up first, enchant only gets asked about words that
+        aren't in there since it also knows forms of words the list doesn't have (plurals, conjugations, ...).
+        The parsed word list is a sorted list searched with bisect, cached on disk under the hash of the word list.
+    """
+
+    def __init__(self, fallback, custom_words: list, word_lists=None):
+        """
+        :param fallback: enchant.Dict asked about words that aren't known
+        :param custom_words: words added with !addword
+        :param word_lists: candidate word list files, WORD_LISTS by default
+        """
+        self.fallback = fallback
+        self.custom_words = set(custom_words)
+        self.words = []
+        for fp in word_lists if word_lists is not None else WORD_LISTS:
+            if os.path.isfile(fp):
+                self.words = self._load_word_list(fp)
+                break
+
+    @staticmethod
+    def _load_word_list(fp) -> list:
+        with open(fp, "rb") as fh:
+            content = fh.read()
+        cache_fp = os.path.join(WORD_LIST_CACHE_DIR, "words-{0}.pickle".format(hashlib.sha1(content).hexdigest()))
+        if os.path.isfile(cache_fp):
+            with open(cache_fp, "rb") as fh:
+                return pickle.load(fh)
+        lines = content.decode("utf-8", "replace").splitlines()
+        if fp.endswith(".dic"):
+            # hunspell files start with the word count and add affix flags after a /
+            lines = [line.split("/")[0].split("\t")[0] for line in lines[1:]]
+        words = sorted(set(line.strip() for line in lines if line.strip()))
+        os.makedirs(WORD_LIST_CACHE_DIR, exist_ok=True)
+        with open(cache_fp, "wb") as fh:
+            pickle.dump(words, fh)
+        return words
+
+    def _known(self, word) -> bool:
+        if word in self.custom_words:
+            return True
+        i = bisect.bisect_left(self.words, word)
+        return i < len(self.words) and self.words[i] == word
+
+    def check(self, word) -> bool:
+        if self._known(word):
+            return True
+        # "Hello" and "HELLO" are spellings of the listed "hello"
+        if (word.istitle() or word.isupper()) and self._known(word.lower()):
+            return True
+        return self.fallback.check(word)
+
+    def add(self, word):
+        self.custom_words.add(word)
+
+
 class RandomLinePicker:
     def __init__(self, fp):
         self.file_pointer = fp
         self.lines_said = []
         self.lines = f.load(fp)
+        # commands of different channels pick lines at the same time, picking and removing a line has to be one step
+        self.lock = Lock()
 
     def get_line(self):
-        if len(self.lines) == 0:
-            self.lines = self.lines_said
-            self.lines_said = []
-        line = random.choice(self.lines)
-        self.lines.remove(line)
-        self.lines_said.append(line)
-        return line
+        with self.lock:
+            if len(self.lines) == 0:
+                self.lines = self.lines_said
+                self.lines_said = []
+            line = random.choice(self.lines)
+            self.lines.remove(line)
+            self.lines_said.append(line)
+            return line
 
     def add_line(self, line: str):
-        if line not in self.lines:
-            self.lines.append(line)
-            f.save(self.lines.extend(self.lines_said), self.file_pointer)
+        with self.lock:
+            if line not in self.lines and line not in self.lines_said:
+                self.lines.append(line)
+                f.save(self.lines + self.lines_said, self.file_pointer)
 
     def remove_line(self, line: str):
-        if line in self.lines:
-            self.lines.remove(line)
-            f.save(self.lines.extend(self.lines_said), self.file_pointer)
-        elif line in self.lines_said:
-            self.lines_said.remove(line)
-            f.save(self.lines.extend(self.lines_said), self.file_pointer)
+        with self.lock:
+            if line in self.lines:
+                self.lines.remove(line)
+            elif line in self.lines_said:
+                self.lines_said.remove(line)
+            else:
+                return
+            f.save(self.lines + self.lines_said, self.file_pointer)
 
 
 class IDCache:
@@ -329,27 +551,599 @@ class CircularArray:
         return item
 
 
+class Persister:
+    """
+        Runs saves on its own thread, whoever asks for a save never waits on serializing or writing to disk.
+        Saves run in the order they were submitted, a save that is still waiting isn't queued a second time.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(name="persister")
+        # name -> save function
+        self.jobs = OrderedDict()
+        # name of the save that is running
+        self.current = None
+        self.running = False
+        self._condition = Condition()
+        self.thread = Thread(target=self.run, name="persister")
+        self.thread.daemon = True
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+
+    def submit(self, name: str, func):
+        with self._condition:
+            if name not in self.jobs:
+                self.jobs[name] = func
+                self._condition.notify_all()
+
+    def pending(self) -> list:
+        """Names of the running and waiting saves"""
+        with self._condition:
+            return ([self.current] if self.current is not None else []) + list(self.jobs.keys())
+
+    def flush(self, timeout=None) -> bool:
+        """Waits at most timeout seconds for every submitted save to finish, returns False if they didn't"""
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self.jobs) == 0 and self.current is None, timeout)
+
+    def stop(self, timeout=None) -> bool:
+        """Stops after the submitted saves are done or timeout seconds passed, returns False if saves were left"""
+        done = self.flush(timeout)
+        if not done:
+            self.logger.critical("Stopping with unfinished saves: {0}".format(self.pending()))
+        with self._condition:
+            self.running = False
+            self._condition.notify_all()
+        return done
+
+    def run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: not self.running or len(self.jobs) != 0)
+                if not self.running:
+                    return
+                name, func = self.jobs.popitem(last=False)
+                self.current = name
+            self.logger.info("Calling {0}".format(name))
+            try:
+                func()
+            except Exception as e:
+                self.logger.exception("{0} failed: {1}".format(name, e))
+            with self._condition:
+                self.current = None
+                self._condition.notify_all()
+
+
+class Journal:
+    """
+        Append-only log of the writes to the stores that are given a journal, one json line per write:
+        [seq, store name, name of the write function, kwargs]. A store replays the writes made after its last saved
+        snapshot when it's created, so a crash only loses what wasn't flushed to the os yet instead of everything since
+        the last save. After a store saved a snapshot it appends a checkpoint line [seq, store name, null, null],
+        compact drops every write that a checkpoint covers.
+        Write functions are looked up by name in functions when replaying, they have to give the same result when
+        replayed in order on top of the snapshot.
+    """
+
+    def __init__(self, fp: str, functions: dict):
+        self.logger = logging.getLogger(name="journal")
+        self.fp = fp
+        self.functions = functions
+        self.lock = Lock()
+        self.records = 0
+        self._fh = None
+        self.closed = False
+        # checkpoints count too, after a compaction they can be all that's left and new writes have to come after them
+        self.seq = max([record[0] for record in self._read()], default=0)
+        # also drops a line cut off by a crash, appending after it would break the next line too
+        self.compact()
+
+    def _size(self) -> int:
+        if self._fh is not None:
+            self._fh.flush()
+        return os.path.getsize(self.fp) if os.path.exists(self.fp) else 0
+
+    def _read(self, end: int = None) -> list:
+        """Returns the records in the first end bytes of the file, all of them if end is None"""
+        records = []
+        if not os.path.exists(self.fp):
+            return records
+        with open(self.fp, "rb") as fh:
+            lines = fh.read(end if end is not None else -1).decode("utf-8", "replace").splitlines()
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                self.logger.warning("Skipping broken journal line: {0}".format(line))
+        return records
+
+    @staticmethod
+    def _checkpoints(records: list) -> dict:
+        checkpoints = {}
+        for seq, name, func_name, kwargs in records:
+            if func_name is None:
+                checkpoints[name] = max(seq, checkpoints.get(name, 0))
+        return checkpoints
+
+    def append(self, name: str, func, kwargs: dict):
+        with self.lock:
+            self.seq += 1
+            self._write([self.seq, name, func.__name__, kwargs])
+
+    def checkpoint(self, name: str, seq: int):
+        """Marks every write of name up to seq as saved in its snapshot"""
+        with self.lock:
+            self._write([seq, name, None, None])
+
+    def _write(self, record: list):
+        if self._fh is None:
+            # closed on shutdown
+            return
+        # flushed right away so the write survives the bot crashing, not the os crashing
+        self._fh.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._fh.flush()
+        self.records += 1
+
+    def replay(self, name: str, data) -> int:
+        """
+            Applies the journaled writes of name that aren't in its snapshot to data.
+        :param data: the snapshot of the store, changed in place
+        :return: amount of writes applied
+        """
+        with self.lock:
+            end = self._size()
+        records = self._read(end)
+        checkpoint = self._checkpoints(records).get(name, 0)
+        applied = 0
+        for seq, record_name, func_name, kwargs in records:
+            if record_name != name or func_name is None or seq <= checkpoint:
+                continue
+            try:
+                self.functions[func_name](data, kwargs)
+                applied += 1
+            except Exception as e:
+                self.logger.warning("Couldn't replay {0} on {1}: {2}".format(func_name, name, e))
+        if applied != 0:
+            self.logger.info("Replayed {0} writes on {1}".format(applied, name))
+        return applied
+
+    def compact(self):
+        """
+            Rewrites the journal without the writes that are in a snapshot, keeping the last checkpoint of every store.
+            The lock is only held to copy over what was appended during the rewrite, appends don't wait on the rest.
+        """
+        with self.lock:
+            end = self._size()
+        records = self._read(end)
+        checkpoints = self._checkpoints(records)
+        kept = [[seq, name, None, None] for name, seq in checkpoints.items()]
+        kept += [record for record in records if record[2] is not None and record[0] > checkpoints.get(record[1], 0)]
+        tmp = self.fp + ".tmp"
+        with open(tmp, "wb") as tmp_fh:
+            tmp_fh.write("".join(json.dumps(record, separators=(",", ":")) + "\n" for record in kept).encode("utf-8"))
+            with self.lock:
+                if self._fh is not None:
+                    self._fh.flush()
+                if os.path.exists(self.fp):
+                    with open(self.fp, "rb") as fh:
+                        fh.seek(end)
+                        tail = fh.read()
+                    tmp_fh.write(tail)
+                    kept += tail.splitlines()
+                tmp_fh.flush()
+                os.fsync(tmp_fh.fileno())
+                if self._fh is not None:
+                    self._fh.close()
+                os.replace(tmp, self.fp)
+                self._fh = open(self.fp, "a", encoding="utf-8") if not self.closed else None
+                self.records = len(kept)
+        self.logger.info("Compacted journal from {0} to {1} lines".format(len(records), len(kept)))
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+
 class LockedData:
-    def __init__(self, obj):
+    def __init__(self, obj, journal: Journal = None, name: str = None):
+        """
+        :param journal: writes are appended to it under name and replayed on obj here, None doesn't journal
+        """
         self.data = obj
         self.lock = Lock()
         self.buffer_dict = dict()
+        self.journal = journal
+        self.name = name
+        # goes up with every change of data, save only saves when it differs from saved_version
+        self.version = 0 if journal is None else journal.replay(name, obj)
+        self.saved_version = 0
 
     def access(self, func, **kwargs):
+        """For funcs that only read data, use write for funcs that change it"""
         self.lock.acquire()
         val = func(self.data, kwargs)
         self.lock.release()
         return val
 
+    def write(self, func, **kwargs):
+        self.lock.acquire()
+        try:
+            val = func(self.data, kwargs)
+            self._written(func, kwargs)
+        finally:
+            self.lock.release()
+        return val
+
+    def _written(self, func, kwargs):
+        self.version += 1
+        if self.journal is not None:
+            self.journal.append(self.name, func, kwargs)
+
     def buffered_write(self, func, **kwargs):
         locked = self.lock.acquire(False)
-        self.buffer_dict[func.__name__] = self.buffer_dict.get(func.__name__, [])
+        buffer = self.buffer_dict.setdefault(func.__name__, deque())
         if locked:
-            if len(self.buffer_dict.get(func.__name__)) != 0:
-                for kwarg in self.buffer_dict.get(func.__name__):
-                    func(self.data, kwarg)
-                self.buffer_dict[func.__name__] = []
-            func(self.data, kwargs)
+            # popped one by one, kwargs buffered while this runs are applied too or wait for the next write
+            while len(buffer) != 0:
+                kwarg = buffer.popleft()
+                func(self.data, kwarg)
+                self._written(func, kwarg)
+            # without kwargs write functions don't change anything, that's how buffers get flushed
+            if len(kwargs) != 0:
+                func(self.data, kwargs)
+                self._written(func, kwargs)
             self.lock.release()
         else:
-            self.buffer_dict.get(func.__name__).append(kwargs)
+            buffer.append(kwargs)
+
+    def changed(self) -> bool:
+        return self.version != self.saved_version
+
+    def save(self, func, **kwargs) -> bool:
+        """
+            Calls func with a copy of data if data changed since the last save.
+            The lock is only held while copying, func does the serializing and writing without it.
+        :return: True if func was called
+        """
+        self.lock.acquire()
+        try:
+            if not self.changed():
+                return False
+            data = copy.deepcopy(self.data)
+            version = self.version
+            seq = self.journal.seq if self.journal is not None else 0
+        finally:
+            self.lock.release()
+        func(data, kwargs)
+        self.saved_version = version
+        if self.journal is not None:
+            self.journal.checkpoint(self.name, seq)
+        return True
+
+
+class CopyOnWriteData:
+    """
+        LockedData for data that is read all the time and rarely changed.
+        Readers get the current version without taking a lock, writers change a copy and swap it in when they're done.
+        Readers never see a half done write and never wait, only writers wait on each other.
+        The data given to access may never be changed in place.
+    """
+
+    def __init__(self, obj, journal: Journal = None, name: str = None):
+        self.data = obj
+        self.lock = Lock()
+        self.journal = journal
+        self.name = name
+        self.version = 0 if journal is None else journal.replay(name, obj)
+        self.saved_version = 0
+
+    def access(self, func, **kwargs):
+        return func(self.data, kwargs)
+
+    def write(self, func, **kwargs):
+        with self.lock:
+            data = copy.deepcopy(self.data)
+            val = func(data, kwargs)
+            self.data = data
+            # only after the swap, a save that sees the new version also sees the new data
+            self.version += 1
+            if self.journal is not None:
+                self.journal.append(self.name, func, kwargs)
+        return val
+
+    def changed(self) -> bool:
+        return self.version != self.saved_version
+
+    def save(self, func, **kwargs) -> bool:
+        """Calls func like access but only if data changed since the last save, returns True if it was called"""
+        with self.lock:
+            # data, version and journal position of the same write
+            data = self.data
+            version = self.version
+            seq = self.journal.seq if self.journal is not None else 0
+        if version == self.saved_version:
+            return False
+        func(data, kwargs)
+        self.saved_version = version
+        if self.journal is not None:
+            self.journal.checkpoint(self.name, seq)
+        return True
+
+
+class TrackedDict(dict):
+    """
+        dict that counts changes to itself and to the dicts nested in it, bot.state uses it so saving can be skipped
+        when nothing changed. Plain dicts stored in it are turned into TrackedDicts of the same root.
+        With a journal every change is journaled as set_in_path or delete_in_path with the keys leading to it.
+    """
+
+    def __init__(self, data=None, root: 'TrackedDict' = None, path: list = None, journal: Journal = None,
+                 name: str = None):
+        super().__init__()
+        self.root = root if root is not None else self
+        self.path = path if path is not None else []
+        self.journal = journal
+        self.name = name
+        self.version = 0
+        self.saved_version = 0
+        data = data if data is not None else {}
+        if root is None and journal is not None:
+            self.version = journal.replay(name, data)
+        for key, val in data.items():
+            super().__setitem__(key, self._track(key, val))
+
+    def _track(self, key, val):
+        path = self.path + [key]
+        if isinstance(val, dict) and not (isinstance(val, TrackedDict) and val.root is self.root and val.path == path):
+            return TrackedDict(val, self.root, path)
+        return val
+
+    def _changed(self, func, kwargs):
+        root = self.root
+        root.version += 1
+        if root.journal is not None:
+            root.journal.append(root.name, func, kwargs)
+
+    def changed(self) -> bool:
+        return self.root.version != self.root.saved_version
+
+    def snapshot(self) -> dict:
+        """Copy of the state as plain dicts, retried when another thread changes the state while it's being copied"""
+        while True:
+            try:
+                return {key: val.snapshot() if isinstance(val, TrackedDict) else copy.deepcopy(val)
+                        for key, val in list(self.items())}
+            except RuntimeError:
+                continue
+
+    def save(self, func, **kwargs) -> bool:
+        """Like LockedData.save, func gets a snapshot, changes made while it runs are saved again the next time"""
+        if not self.changed():
+            return False
+        version = self.version
+        seq = self.journal.seq if self.journal is not None else 0
+        func(self.snapshot(), kwargs)
+        self.saved_version = version
+        if self.journal is not None:
+            self.journal.checkpoint(self.name, seq)
+        return True
+
+    def __setitem__(self, key, val):
+        val = self._track(key, val)
+        super().__setitem__(key, val)
+        self._changed(set_in_path, {"path": self.path + [key], "val": val})
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._changed(delete_in_path, {"path": self.path + [key]})
+
+    def pop(self, key, *default):
+        val = super().pop(key, *default)
+        self._changed(delete_in_path, {"path": self.path + [key]})
+        return val
+
+    def popitem(self):
+        item = super().popitem()
+        self._changed(delete_in_path, {"path": self.path + [item[0]]})
+        return item
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self.get(key)
+
+    def update(self, *args, **kwargs):
+        for key, val in dict(*args, **kwargs).items():
+            self[key] = val
+
+    def clear(self):
+        for key in list(self.keys()):
+            del self[key]
+
+
+def set_in_path(dct, kwargs):
+    """Write function of TrackedDict, sets the value at the end of the keys in path"""
+    if "path" in kwargs and "val" in kwargs:
+        path = kwargs.get("path")
+        for key in path[:-1]:
+            dct = dct.setdefault(key, {})
+        dct[path[-1]] = kwargs.get("val")
+
+
+def delete_in_path(dct, kwargs):
+    """Write function of TrackedDict, removes the value at the end of the keys in path"""
+    if "path" in kwargs:
+        path = kwargs.get("path")
+        for key in path[:-1]:
+            dct = dct.get(key, {})
+        dct.pop(path[-1], None)
+
+
+class StreakTable:
+    """
+        Emote streaks of one channel, a streak being the amount of consecutive messages that contain the emote.
+        Messages get numbered and every emote on a streak remembers the message its streak started at, so the current
+        streak follows from the number of the last message. A message only touches its own emotes and the emotes of
+        the previous message, whose streak ends when they're missing from this one.
+        Max streaks are also kept in a sorted ranking that's updated whenever a max changes, ties are ranked by which
+        emote was seen first.
+    """
+
+    def __init__(self, streaks: dict = None):
+        """
+        :param streaks: emote -> {"current": str, "max": str} as stored in texts/streaks.txt
+        """
+        self.seq = 0
+        self.start = {}
+        self.max = {}
+        self.order = {}
+        # sorted (-max, order, emote)
+        self.ranking = []
+        # emotes in the last message, the ones that are on a streak
+        self.active = set()
+        for emote, streak in (streaks or {}).items():
+            current = int(streak.get("current", "0"))
+            self._set_max(emote, int(streak.get("max", "0")))
+            if current > 0:
+                self.start[emote] = self.seq - current + 1
+                self.active.add(emote)
+
+    def __contains__(self, emote):
+        return emote in self.max
+
+    def _set_max(self, emote, value: int):
+        if emote in self.max:
+            old = (-self.max.get(emote), self.order.get(emote), emote)
+            self.ranking.pop(bisect.bisect_left(self.ranking, old))
+        else:
+            self.order[emote] = len(self.order)
+        self.max[emote] = value
+        bisect.insort(self.ranking, (-value, self.order.get(emote), emote))
+
+    def current(self, emote) -> int:
+        if emote not in self.active:
+            return 0
+        return self.seq - self.start.get(emote) + 1
+
+    def update(self, emotes: set):
+        """Counts the next message of the channel, emotes are the unique emotes in it"""
+        for emote in self.active - emotes:
+            if self.current(emote) > self.max.get(emote):
+                self._set_max(emote, self.current(emote))
+            self.start.pop(emote)
+        self.seq += 1
+        for emote in emotes:
+            if emote not in self.active:
+                self.start[emote] = self.seq
+                if emote not in self.max:
+                    self._set_max(emote, 0)
+        self.active = set(emotes)
+
+    def reset(self, emote):
+        if emote in self.max:
+            self._set_max(emote, 0)
+
+    def top(self, amount: int) -> list:
+        """(emote, max streak) of the amount emotes with the highest max streak"""
+        return [(emote, -negative_max) for negative_max, order, emote in self.ranking[:amount]]
+
+    def get(self, emote):
+        if emote not in self.max:
+            return None
+        return {"current": str(self.current(emote)), "max": str(self.max.get(emote))}
+
+    def to_dict(self) -> dict:
+        return {emote: self.get(emote) for emote in self.max}
+
+
+class LackStatsWriter:
+    """
+        Counts lacks in memory and writes them to mongo from a background thread, chat handling never waits on mongo.
+        Counts are kept per (channel, emote, spelling, activity, time bucket) and every flush sends them as $inc upserts
+        in unordered bulk_writes of at most batch_size operations, so a bucket ends up as one document no matter how
+        many flushes it took.
+    """
+
+    def __init__(self, collection, interval=LACK_FLUSH_INTERVAL, batch_size=LACK_FLUSH_BATCH_SIZE,
+                 bucket_seconds=LACK_BUCKET_SECONDS):
+        """
+        :param collection: pymongo collection the counts are stored in
+        :param interval: seconds between flushes
+        :param batch_size: max operations per bulk_write
+        :param bucket_seconds: size of the time buckets counts are grouped in
+        """
+        self.logger = logging.getLogger(name="lack_stats")
+        self.collection = collection
+        self.interval = interval
+        self.batch_size = batch_size
+        self.bucket_seconds = bucket_seconds
+        self.counts = {}
+        self.last_flush = {"documents": 0, "seconds": 0.0}
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._stopped = Event()
+        self.thread = Thread(target=self.run, name="lack_stats")
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self.flush()
+
+    def add(self, channel, lacks: list, activity):
+        """
+        :param lacks: list of (spelling, emote) tuples
+        """
+        bucket = int(time.time()) // self.bucket_seconds * self.bucket_seconds
+        with self._lock:
+            for spelling, emote in lacks:
+                key = (channel, emote, spelling, activity, bucket)
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self.counts)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                counts = self.counts
+                self.counts = {}
+            if len(counts) == 0:
+                return
+            started = time.monotonic()
+            items = list(counts.items())
+            operations = [UpdateOne({"channel": channel, "emote": emote, "spelling": spelling, "activity": activity,
+                                     "timestamp": datetime.datetime.utcfromtimestamp(bucket)},
+                                    {"$inc": {"count": count}}, upsert=True)
+                          for (channel, emote, spelling, activity, bucket), count in items]
+            for i in range(0, len(operations), self.batch_size):
+                try:
+                    self.collection.bulk_write(operations[i:i + self.batch_size], ordered=False)
+                except Exception as e:
+                    # counts that weren't written are kept for the next flush, the rest of an unordered batch that
+                    # failed partially is in the database and must not be counted twice
+                    self.logger.exception("Flushing lack counts failed")
+                    unwritten = items[i + self.batch_size:]
+                    if isinstance(e, BulkWriteError):
+                        unwritten += [items[i + error.get("index")] for error in e.details.get("writeErrors", [])]
+                    else:
+                        unwritten += items[i:i + self.batch_size]
+                    with self._lock:
+                        for key, count in unwritten:
+                            self.counts[key] = self.counts.get(key, 0) + count
+                    return
+            self.last_flush = {"documents": len(operations), "seconds": time.monotonic() - started}
+            self.logger.info("Flushed {0} lack counts in {1:.0f} ms".format(len(operations),
+                                                                          self.last_flush.get("seconds") * 1000))
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.flush()
@@ -1,3 +1,7 @@
+import os
+import re
+
+
 def save(obj, fp: str, pretty=True):
     try:
         for item in obj:
@@ -6,10 +10,14 @@ def save(obj, fp: str, pretty=True):
         print(e)
     else:
         txt = to_pretty_txt(obj) if pretty else to_txt(obj)
-        fh = open(fp, "w+")
+        # write next to fp and swap it in, a crash during the write leaves the old file intact
+        tmp = fp + ".tmp"
+        fh = open(tmp, "w+")
         fh.write(txt)
         fh.flush()
+        os.fsync(fh.fileno())
         fh.close()
+        os.replace(tmp, fp)
 
 
 def load(fp: str, default=None):
@@ -19,7 +27,7 @@ def load(fp: str, default=None):
         fh = open(fp, "w+")
         fh.close()
         fh = open(fp, "r")
-    txt = clean_txt("".join(fh.readlines()))
+    txt = clean_txt(fh.read())
     fh.close()
     obj = from_text(txt)
     if obj is None and default is not None:
@@ -28,143 +36,246 @@ def load(fp: str, default=None):
 
 
 def to_txt(obj):
-    txt = ""
-    if isinstance(obj, list):
-        items = iterable_to_strings(obj)
-        txt += "["
-        txt += ",".join(items)
-        txt += "]"
-        return txt
-    elif isinstance(obj, tuple):
-        items = iterable_to_strings(obj)
-        txt += "("
-        txt += ",".join(items)
-        txt += ")"
-        return txt
-    elif isinstance(obj, set):
-        items = iterable_to_strings(obj)
-        txt += "{["
-        txt += ",".join(items)
-        txt += "]}"
-        return txt
-    elif isinstance(obj, dict):
-        items = []
-        for key, val in obj.items():
-            items.append(str(key).replace(":", "\\72") + ":" + to_txt(val))
-        txt += "{"
-        txt += ",".join(items)
-        txt += "}"
-        return txt
-    else:
-        return str(obj).replace(" ", "-_-").replace(",", "\\44")
+    parts = []
+    _write(obj, parts)
+    return "".join(parts)
 
 
 def to_pretty_txt(obj):
-    txt = ""
-    if isinstance(obj, list):
-        items = iterable_to_strings(obj, True)
-        txt += "[\n"
-        txt += ",\n".join(items)
-        txt += "\n]"
-        return txt
-    elif isinstance(obj, tuple):
-        items = iterable_to_strings(obj, True)
-        txt += "(\n"
-        txt += ",\n".join(items)
-        txt += "\n)"
-        return txt
-    elif isinstance(obj, set):
-        items = iterable_to_strings(obj, True)
-        txt += "{[\n"
-        txt += ",\n".join(items)
-        txt += "\n]}"
-        return txt
-    elif isinstance(obj, dict):
-        items = []
+    """Like to_txt but every item of the outer iterable gets its own indented line"""
+    if isinstance(obj, (list, tuple, set, dict)):
+        parts = []
+        _write(obj, parts, ",\n", " " * 4)
+        return "".join(parts)
+    return to_txt(obj)
+
+
+# opening and closing text of every iterable type to_txt supports
+BRACKETS = {list: ("[", "]"), tuple: ("(", ")"), set: ("{[", "]}"), dict: ("{", "}")}
+
+
+def _scalar_txt(obj) -> str:
+    return str(obj).replace(" ", "-_-").replace(",", "\\44")
+
+
+def _write(obj, parts: list, separator=",", indent=""):
+    """Appends the text of obj to parts, which get joined once at the end instead of concatenating at every level"""
+    kind = type(obj)
+    if kind not in BRACKETS:
+        kind = next((iterable for iterable in BRACKETS if isinstance(obj, iterable)), None)
+        if kind is None:
+            parts.append(_scalar_txt(obj))
+            return
+    opening, closing = BRACKETS.get(kind)
+    newline = "\n" if len(indent) != 0 else ""
+    parts.append(opening + newline)
+    if kind is dict:
         for key, val in obj.items():
-            items.append(" " * 4 + str(key).replace(":", "\\72") + ":" + to_txt(val))
-        txt += "{\n"
-        txt += ",\n".join(items)
-        txt += "\n}"
-        return txt
+            parts.append(indent + str(key).replace(":", "\\72") + ":")
+            if type(val) is str:
+                parts.append(_scalar_txt(val))
+            else:
+                _write(val, parts)
+            parts.append(separator)
     else:
-        return str(obj).replace(" ", "-_-").replace(",", "\\44")
+        for item in obj:
+            if len(indent) != 0:
+                parts.append(indent)
+            if type(item) is str:
+                parts.append(_scalar_txt(item))
+            else:
+                _write(item, parts)
+            parts.append(separator)
+    if len(obj) != 0:
+        # the separator after the last item
+        parts.pop()
+    parts.append(newline + closing)
 
 
 def iterable_to_strings(iterable, pretty=False):
-    items = []
-    for item in iterable:
-        txt = to_txt(item) if not pretty else " " * 4 + to_txt(item)
-        items.append(txt)
-    return items
+    return [to_txt(item) if not pretty else " " * 4 + to_txt(item) for item in iterable]
+
+
+WHITESPACE = str.maketrans("", "", " \n\t")
 
 
 def clean_txt(txt):
-    return "".join(char for char in txt if char not in [" ", "\n", "\t"])
+    return txt.translate(WHITESPACE)
 
 
-def from_text(txt):
-    if len(txt) == 0:
-        return
-    bracket = txt[0]
-    content = txt[1:-1]
-    if bracket == "[":
-        # list
-        lst = []
-        list_items = all_items(content)
-        for item in list_items:
-            lst.append(from_text(item))
-        return lst
-    elif bracket == "(":
-        # tuple
-        lst = []
-        list_items = all_items(content)
-        for item in list_items:
-            lst.append(from_text(item))
-        return tuple(lst)
-    elif bracket == "{":
-        # set or dict
-        if len(content) != 0 and content[0] == "[":
-            # set
-            content = content[1:-1]
-            st = set()
-            for item in all_items(content):
-                st.add(from_text(item))
-            return st
-        else:
-            # dict
-            dct = {}
-            for item in all_items(content):
-                # Items should be in shape of (key):(possible iterable or txt)
-                key, value = item.split(":", maxsplit=1)
-                dct[key.replace("\\72", ":")] = from_text(value)
-            return dct
-    else:
-        # not an iterable
-        return txt.replace("-_-", " ").replace("\\44", ",")
+# every character that can open, close or split an iterable
+TOKEN_REGEX = re.compile(r"[\[\](){},]")
+OPENING = "{[("
+KINDS = {"[": list, "(": tuple, "{": dict}
 
 
-def all_items(txt):
-    brackets_open = 0
-    items = []
-    item = ""
-    for char in txt:
-        if brackets_open == 0:
-            if char not in ["{", "[", "("]:
-                if char == ",":
-                    items.append(item)
-                    item = ""
+class _Iterable:
+    """An iterable Parser found in the text, with the items it has so far"""
+    __slots__ = ("kind", "start", "known_end", "depth", "brackets", "values", "spans", "item_start", "child")
+
+    def __init__(self, txt: str, start: int, known_end: int, depth: int):
+        kind = KINDS.get(txt[start])
+        if kind is dict and txt.startswith("[", start + 1):
+            kind = set
+        opening = 2 if kind is set else 1
+        self.kind = kind
+        self.start = start
+        # the items that end at a comma before known_end are in it for sure and get made right away
+        # a set ends two characters before the end of its item, that can be before the last comma it saw
+        self.known_end = known_end if kind is not set else -1
+        # brackets opened in the current item that aren't an iterable of their own
+        self.depth = 0
+        # closing brackets it takes until the parent splits items again: the ones that were open in the parent's item
+        # and its own opening, "{[" for a set
+        self.brackets = depth + opening
+        # sets get their items as they're made, an unhashable item raises before the items after it are made
+        self.values = {} if kind is dict else set() if kind is set else []
+        # start, end and nested iterable or None of the items that ended at a comma past known_end, they're made once the
+        # end of the iterable is known
+        self.spans = []
+        self.item_start = start + opening
+        # iterable at the start of the current item, or of its value in a dict
+        self.child = None
+
+
+class Parser:
+    """
+        Parses the text to_txt writes in one left to right pass over the positions of its brackets and commas.
+        A bracket at the start of an item, or right after the first colon of a dict item, opens a nested iterable. Any
+        other bracket is part of a value and only keeps the commas inside of it from splitting the item. A closing
+        bracket closes the innermost iterable whatever its type, and the content of an iterable ends a character before
+        the end of the item it's in. So values with brackets in them and other text to_txt doesn't write parse the same
+        as they always did.
+    """
+
+    def __init__(self, txt: str):
+        self.txt = txt
+
+    def parse(self):
+        txt = self.txt
+        if len(txt) == 0:
+            return None
+        if txt[0] not in OPENING:
+            # not an iterable
+            return txt.replace("-_-", " ").replace("\\44", ",")
+        # the content of an iterable ends a character before the end of the item it's in, after its closing bracket
+        # unless it's still open at the end of the text
+        root = _Iterable(txt, 0, len(txt) - 1, 0)
+        # iterables that are still open, the innermost one is also in current
+        # root is never closed, its item is the whole text so it splits its items up to the end of it
+        stack = [root]
+        current = root
+        # the innermost iterable once it's closed, its last item goes on till current splits and a dict can still get
+        # an iterable as the value of it
+        tail = None
+        for match in TOKEN_REGEX.finditer(txt, root.item_start):
+            position = match.start()
+            char = txt[position]
+            if char == ",":
+                if current.depth == 0:
+                    if position < current.known_end:
+                        self._add(current, current.item_start, position, current.child)
+                    else:
+                        current.spans += current.item_start, position, current.child
+                    current.item_start = position + 1
+                    current.child = None
+                    tail = None
+            elif char in OPENING:
+                owner = current if tail is None else tail
+                if position < owner.item_start:
+                    # the "[" of a set that was just opened
+                    continue
+                if owner.child is None and (position == owner.item_start if owner.kind is not dict
+                                            else txt.find(":", owner.item_start, position) == position - 1):
+                    # the last item of a closed iterable can end right after the closing brackets of one opened in it
+                    known_end = current.known_end - 1 if owner is current else -1
+                    owner.child = _Iterable(txt, position, known_end, current.depth)
+                    current = owner.child
+                    stack.append(current)
+                    tail = None
                 else:
-                    item += char
+                    current.depth += 1
+            elif current.depth != 0:
+                current.depth -= 1
+            elif current is not root:
+                current.brackets -= 1
+                if current.brackets == 0:
+                    stack.pop()
+                    if tail is None:
+                        tail = current
+                    current = stack[-1]
+                    current.depth = 0
+        return self._build(root, len(txt))
+
+    def _add(self, iterable: _Iterable, start: int, end: int, child):
+        """Adds the item in txt[start:end] to the values of iterable, child is the iterable the item starts with"""
+        txt = self.txt
+        if iterable.kind is dict:
+            # Items should be in shape of (key):(possible iterable or txt)
+            # the colon of an item with an iterable value is right before it
+            colon = child.start - 1 if child is not None and child.start < end else txt.find(":", start, end)
+            if colon == -1:
+                raise ValueError("dict item without a key: " + txt[start:end])
+            if end <= colon + 1:
+                value = None
+            elif child is not None:
+                value = self._build(child, end)
             else:
-                item += char
-                brackets_open += 1
+                value = txt[colon + 1:end].replace("-_-", " ").replace("\\44", ",")
+            iterable.values[txt[start:colon].replace("\\72", ":")] = value
+            return
+        if end <= start:
+            value = None
+        elif child is not None:
+            value = self._build(child, end)
+        else:
+            value = txt[start:end].replace("-_-", " ").replace("\\44", ",")
+        if iterable.kind is set:
+            iterable.values.add(value)
         else:
-            if char in ["}", ")", "]"]:
-                brackets_open -= 1
-            if char in ["{", "[", "("]:
-                brackets_open += 1
-            item += char
-    if len(item) != 0:
-        items.append(item)
+            iterable.values.append(value)
+
+    def _build(self, iterable: _Iterable, end: int):
+        """The object of an iterable that's in an item ending right before end"""
+        content_start = iterable.start + 1
+        content_end = max(content_start, end - 1)
+        if iterable.kind is set:
+            if content_end == content_start:
+                # "{[" and nothing else is an empty dict
+                return {}
+            content_end = max(content_start + 1, content_end - 1)
+        spans = iterable.spans
+        spans += iterable.item_start, content_end, iterable.child
+        spans = iter(spans)
+        for start, item_end, child in zip(spans, spans, spans):
+            if item_end < content_end:
+                self._add(iterable, start, item_end, child)
+            else:
+                # the last item runs up to the end of the content
+                if content_end > start:
+                    self._add(iterable, start, content_end, child)
+                break
+        return tuple(iterable.values) if iterable.kind is tuple else iterable.values
+
+
+def from_text(txt):
+    return Parser(txt).parse()
+
+
+def all_items(txt):
+    """The text of every item in the content of an iterable"""
+    items = []
+    depth = 0
+    item_start = 0
+    for match in TOKEN_REGEX.finditer(txt):
+        char = match.group()
+        if char in OPENING:
+            depth += 1
+        elif char != ",":
+            depth = max(0, depth - 1)
+        elif depth == 0:
+            items.append(txt[item_start:match.start()])
+            item_start = match.start() + 1
+    if len(txt) > item_start:
+        items.append(txt[item_start:])
     return items
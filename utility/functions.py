@@ -81,3 +81,21 @@ def count_capitals(text: str):
         if char.isupper():
             count += 1
     return count
+
+
+def emote_ranges(emotes_tag: str) -> set:
+    """
+        Parses the emotes tag twitch sends with every PRIVMSG, "id:start-end,start-end/id:start-end".
+    :param emotes_tag: value of the emotes tag, empty when the message has no twitch emotes
+    :return: set of (start, end) character ranges of the emotes in the message, end included
+    """
+    ranges = set()
+    if not emotes_tag:
+        return ranges
+    for emote in emotes_tag.split("/"):
+        positions = emote.partition(":")[2]
+        for position in positions.split(","):
+            start, _, end = position.partition("-")
+            if start.isdigit() and end.isdigit():
+                ranges.add((int(start), int(end)))
+    return ranges
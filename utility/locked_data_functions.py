@@ -1,3 +1,6 @@
+from utility.classes import StreakTable, set_in_path, delete_in_path
+
+
 def write_to_dict(dct, kwargs):
     if "key" in kwargs and "val" in kwargs:
         dct[kwargs.get("key")] = kwargs.get("val")
@@ -67,29 +70,16 @@ def list_in_dict_contains(dct, kwargs):
 def update_streak_inner(dct, kwargs):
     if "emotes" in kwargs and "channel" in kwargs:
         channel = kwargs.get("channel")
-        emotes = kwargs.get("emotes")
-        dct[channel] = dct.get(channel, {})
-        for emote in emotes:
-            if emote not in dct[channel]:
-                dct[channel][emote] = {"current": "0", "max": "0"}
-        for emote, streak in dct[channel].items():
-            if emote in emotes:
-                streak["current"] = str(int(streak.get("current")) + 1)
-            elif int(streak["current"]) > int(streak["max"]):
-                streak["max"] = streak["current"]
-                streak["current"] = "0"
-            else:
-                streak["current"] = "0"
+        dct[channel] = dct.get(channel, StreakTable())
+        dct[channel].update(set(kwargs.get("emotes")))
 
 
 def reset_streak_inner(dct, kwargs):
     if "emote" in kwargs and "channel" in kwargs:
         emote = kwargs.get("emote")
         channel = kwargs.get("channel")
-        print(emote)
-        if emote in dct[channel]:
-            print("trying to reset")
-            dct[channel][emote]["max"] = "0"
+        if channel in dct:
+            dct[channel].reset(emote)
 
 
 def get_data(data, kwargs):
@@ -115,3 +105,34 @@ def add_tie(data, kwargs):
         user = kwargs.get("user")
         (wins, losses, ties) = data.get(user, ("0", "0", "0"))
         data[user] = (wins, losses, str(int(ties) + 1))
+
+
+def add_role_inner(data, kwargs):
+    if "user" in kwargs and "channel" in kwargs and "role" in kwargs:
+        user = kwargs.get("user")
+        channel = kwargs.get("channel")
+        role = kwargs.get("role")
+        if user not in data:
+            data[user] = {}
+        if channel not in data.get(user):
+            data[user][channel] = []
+        if role not in data.get(user).get(channel):
+            data[user][channel].append(role)
+
+
+def remove_role_inner(data, kwargs):
+    if "user" in kwargs and "channel" in kwargs and "role" in kwargs:
+        user = kwargs.get("user")
+        channel = kwargs.get("channel")
+        role = kwargs.get("role")
+        if user in data:
+            if channel in data.get(user, {}):
+                if role in data.get(user).get(channel, []):
+                    data[user][channel].remove(role)
+
+
+# write functions of the journaled stores, the journal looks them up by name when replaying
+JOURNAL_FUNCTIONS = {func.__name__: func for func in
+                     [write_to_dict, delete_from_dict, add_to_container, delete_from_set, append_to_list_in_dict,
+                      delete_from_list_in_dict, add_win, add_loss, add_tie, add_role_inner, remove_role_inner,
+                      set_in_path, delete_in_path]}
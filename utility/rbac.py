@@ -1,11 +1,13 @@
 from utility import file_loader as f
+from utility import sqlite_store
 from utility.classes import LockedData
+from utility.locked_data_functions import add_role_inner, remove_role_inner
 from credentials import mongo_credentials
 from datetime import datetime
 import pymongo
 
 ROLES = {}
-users = LockedData(f.load("texts/user_roles.txt", {}))
+users = sqlite_store.open_store("users") if sqlite_store.enabled() else LockedData(f.load("texts/user_roles.txt", {}))
 
 
 def addRole(role):
@@ -59,36 +61,12 @@ def get_allowed_functions(user, channel):
 
 def add_role(user, role, channel):
     global users
-
-    def add_role_inner(data, kwargs):
-        if "user" in kwargs and "channel" in kwargs and "role" in kwargs:
-            user = kwargs.get("user")
-            channel = kwargs.get("channel")
-            role = kwargs.get("role")
-            if user not in data:
-                data[user] = {}
-            if channel not in data.get(user):
-                data[user][channel] = []
-            if role not in data.get(user).get(channel):
-                data[user][channel].append(role)
-
-    users.access(add_role_inner, user=user, channel=channel, role=role)
+    users.write(add_role_inner, user=user, channel=channel, role=role)
 
 
 def remove_role(user, role, channel):
     global users
-
-    def remove_role_inner(data, kwargs):
-        if "user" in kwargs and "channel" in kwargs and "role" in kwargs:
-            user = kwargs.get("user")
-            channel = kwargs.get("channel")
-            role = kwargs.get("role")
-            if user in data:
-                if channel in data.get(user, {}):
-                    if role in data.get(user).get(channel, []):
-                        data[user][channel].remove(role)
-
-    users.access(remove_role_inner, user=user, channel=channel, role=role)
+    users.write(remove_role_inner, user=user, channel=channel, role=role)
 
 
 client = pymongo.MongoClient("mongodb://{}:{}@127.0.0.1:27017/".format(mongo_credentials.user, mongo_credentials.pwd))
@@ -0,0 +1,318 @@
+"""
+    Optional sqlite storage for the stores that grow with the amount of users: roles, alts, grants, custom commands and
+    rps scores. Every store is a table with an index on its keys and is seen through SqliteMapping as the same nested
+    dicts the text files hold, so the functions in locked_data_functions and rbac work on both. Writes change only the
+    rows they touch instead of rewriting a whole file.
+
+    The bot uses sqlite when DB_FILE exists, it's created by importing the text files once:
+    python -m utility.sqlite_store
+"""
+import os
+import sqlite3
+from collections.abc import MutableMapping
+from threading import RLock
+from utility import file_loader as f
+from utility.classes import LockedData, Journal, JOURNAL_FILE
+from utility.locked_data_functions import JOURNAL_FUNCTIONS
+
+DB_FILE = "texts/bot.db"
+# store name -> (key columns, value columns, True if a key holds a list of values)
+TABLES = {
+    "users": (("user", "channel"), ("role",), True),
+    "alts": (("alt",), ("main",), False),
+    "grants": (("user",), ("word",), True),
+    "commands": (("name",), ("response",), False),
+    "rps": (("user",), ("wins", "losses", "ties"), False),
+}
+# store name -> text file it's imported from
+TEXTS = {
+    "users": "texts/user_roles.txt",
+    "alts": "texts/alts.txt",
+    "grants": "texts/grants.txt",
+    "commands": "texts/commands.txt",
+    "rps": "texts/rps.txt",
+}
+
+_db = None
+
+
+def enabled() -> bool:
+    return os.path.exists(DB_FILE)
+
+
+def database() -> 'SqliteDB':
+    """The connection every store shares, opened the first time it's needed"""
+    global _db
+    if _db is None:
+        _db = SqliteDB(DB_FILE)
+    return _db
+
+
+def open_store(name: str) -> 'SqliteData':
+    db = database()
+    return SqliteData(db, db.table(name))
+
+
+class SqliteDB:
+    def __init__(self, fp: str):
+        self.conn = sqlite3.connect(fp, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # every query goes through this lock, the connection is shared by all threads
+        self.lock = RLock()
+        self.tables = {}
+
+    def table(self, name: str) -> 'SqliteTable':
+        with self.lock:
+            if name not in self.tables:
+                keys, values, many = TABLES.get(name)
+                self.tables[name] = SqliteTable(self, name, keys, values, many)
+            return self.tables.get(name)
+
+    def execute(self, sql: str, params=()) -> list:
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+
+class SqliteTable:
+    """
+        A table seen as nested dicts, every key column is a level of dicts and the value columns are the value at the
+        end of the keys, a tuple if there's more than one. When many is True the keys hold a list of values instead.
+    """
+
+    def __init__(self, db: SqliteDB, name: str, keys: tuple, values: tuple, many: bool):
+        self.db = db
+        self.name = name
+        self.keys = keys
+        self.values = values
+        self.many = many
+        # keys that were set to an empty dict or list, they exist without rows until something is added to them
+        self.empty = set()
+        columns = ", ".join(column + " TEXT NOT NULL" for column in keys + values)
+        unique = "" if many else ", PRIMARY KEY ({0})".format(", ".join(keys))
+        with db.lock:
+            db.conn.execute("CREATE TABLE IF NOT EXISTS {0} ({1}{2})".format(name, columns, unique))
+            if many:
+                db.conn.execute("CREATE INDEX IF NOT EXISTS {0}_keys ON {0} ({1})".format(name, ", ".join(keys)))
+            db.conn.commit()
+
+    def root(self) -> 'SqliteMapping':
+        return SqliteMapping(self, ())
+
+    def _where(self, prefix: tuple) -> str:
+        if len(prefix) == 0:
+            return ""
+        return " WHERE " + " AND ".join(column + " = ?" for column in self.keys[:len(prefix)])
+
+    def exists(self, prefix: tuple) -> bool:
+        rows = self.db.execute("SELECT 1 FROM {0}{1} LIMIT 1".format(self.name, self._where(prefix)), prefix)
+        return len(rows) != 0 or prefix in self.empty
+
+    def children(self, prefix: tuple) -> list:
+        """Distinct keys of the level under prefix, in the order they were added"""
+        column = self.keys[len(prefix)]
+        with self.db.lock:
+            rows = self.db.execute("SELECT {0} FROM {1}{2} GROUP BY {0} ORDER BY MIN(rowid)".format(
+                column, self.name, self._where(prefix)), prefix)
+            keys = [row[0] for row in rows]
+            found = set(keys)
+            return keys + [key[-1] for key in self.empty
+                           if len(key) == len(prefix) + 1 and key[:-1] == prefix and key[-1] not in found]
+
+    def rows(self, prefix: tuple) -> list:
+        """Value columns of the rows under prefix"""
+        return self.db.execute("SELECT {0} FROM {1}{2} ORDER BY rowid".format(
+            ", ".join(self.values), self.name, self._where(prefix)), prefix)
+
+    def delete(self, prefix: tuple):
+        with self.db.lock:
+            self.db.execute("DELETE FROM {0}{1}".format(self.name, self._where(prefix)), prefix)
+            self.empty = {key for key in self.empty if key[:len(prefix)] != prefix}
+
+    def insert(self, keys: tuple, value):
+        values = tuple(value) if len(self.values) > 1 and not self.many else (value,)
+        with self.db.lock:
+            self.db.execute("INSERT OR REPLACE INTO {0} VALUES ({1})".format(
+                self.name, ", ".join("?" for _ in self.keys + self.values)), keys + tuple(str(val) for val in values))
+            # the keys leading to the row exist now that it does
+            for i in range(len(keys) + 1):
+                self.empty.discard(keys[:i])
+
+    def remove_one(self, keys: tuple, value):
+        rows = self.db.execute("SELECT rowid FROM {0}{1} AND {2} = ? ORDER BY rowid LIMIT 1".format(
+            self.name, self._where(keys), self.values[0]), keys + (value,))
+        if len(rows) == 0:
+            raise ValueError("{0} not in {1}".format(value, self.name))
+        self.db.execute("DELETE FROM {0} WHERE rowid = ?".format(self.name), (rows[0][0],))
+
+    def fill(self, prefix: tuple, obj):
+        """Adds the plain dicts, lists or values in obj under prefix, the caller holds the lock of the database"""
+        if len(prefix) < len(self.keys):
+            if len(obj) == 0:
+                self.empty.add(prefix)
+            for key, val in obj.items():
+                self.fill(prefix + (key,), val)
+        elif self.many:
+            if len(obj) == 0:
+                self.empty.add(prefix)
+            for val in obj:
+                self.insert(prefix, val)
+        else:
+            self.insert(prefix, obj)
+
+
+class SqliteMapping(MutableMapping):
+    """One level of dicts of a SqliteTable, reads and writes go straight to the table"""
+
+    def __init__(self, table: SqliteTable, prefix: tuple):
+        self.table = table
+        self.prefix = prefix
+
+    def _child(self, key):
+        keys = self.prefix + (key,)
+        if len(keys) < len(self.table.keys):
+            return SqliteMapping(self.table, keys)
+        if self.table.many:
+            return SqliteList(self.table, keys)
+        row = self.table.rows(keys)[0]
+        return row[0] if len(row) == 1 else tuple(row)
+
+    def __contains__(self, key):
+        return self.table.exists(self.prefix + (key,))
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        return self._child(key)
+
+    def __setitem__(self, key, val):
+        keys = self.prefix + (key,)
+        if isinstance(val, (SqliteMapping, SqliteList)) and val.table is self.table and val.prefix == keys:
+            # dct[key] = dct.get(key, []) style writes, it's already there
+            return
+        val = to_plain(val)
+        with self.table.db.lock:
+            self.table.delete(keys)
+            self.table.fill(keys, val)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.table.delete(self.prefix + (key,))
+
+    def pop(self, key, *default):
+        if key not in self:
+            if len(default) != 0:
+                return default[0]
+            raise KeyError(key)
+        val = to_plain(self._child(key))
+        del self[key]
+        return val
+
+    def __iter__(self):
+        return iter(self.table.children(self.prefix))
+
+    def __len__(self):
+        return len(self.table.children(self.prefix))
+
+    def __repr__(self):
+        return repr(to_plain(self))
+
+
+class SqliteList:
+    """The list of values of a key in a table where keys hold many values"""
+
+    def __init__(self, table: SqliteTable, prefix: tuple):
+        self.table = table
+        self.prefix = prefix
+
+    def _values(self) -> list:
+        return [row[0] for row in self.table.rows(self.prefix)]
+
+    def __iter__(self):
+        return iter(self._values())
+
+    def __len__(self):
+        return len(self._values())
+
+    def __getitem__(self, i):
+        return self._values()[i]
+
+    def __contains__(self, val):
+        return val in self._values()
+
+    def __eq__(self, other):
+        return self._values() == list(other)
+
+    def append(self, val):
+        self.table.insert(self.prefix, val)
+
+    def remove(self, val):
+        self.table.remove_one(self.prefix, val)
+
+    def __repr__(self):
+        return repr(self._values())
+
+
+def to_plain(obj):
+    """Copies table views into plain dicts and lists, anything else is returned as is"""
+    if isinstance(obj, SqliteMapping):
+        return {key: to_plain(obj[key]) for key in obj}
+    if isinstance(obj, SqliteList):
+        return list(obj)
+    return obj
+
+
+class SqliteData(LockedData):
+    """
+        LockedData over a table, every write is committed as one transaction when it's done.
+        There's nothing to save, so save never calls its function and these stores aren't journaled.
+    """
+
+    def __init__(self, db: SqliteDB, table: SqliteTable):
+        super().__init__(table.root())
+        self.db = db
+        # one lock for all stores, they share the connection
+        self.lock = db.lock
+
+    def write(self, func, **kwargs):
+        with self.lock:
+            # commits when func returns, rolls back when it raises
+            with self.db.conn:
+                return func(self.data, kwargs)
+
+    def _written(self, func, kwargs):
+        self.db.conn.commit()
+
+    def changed(self) -> bool:
+        return False
+
+    def save(self, func, **kwargs) -> bool:
+        return False
+
+
+def import_texts(fp: str = DB_FILE):
+    """
+        Creates the database at fp from the text files, writes in the journal that weren't saved yet are included.
+        Run it while the bot is stopped.
+    """
+    if os.path.exists(fp):
+        print("{0} already exists, remove it to import again".format(fp))
+        return
+    journal = Journal(JOURNAL_FILE, JOURNAL_FUNCTIONS)
+    db = SqliteDB(fp)
+    for name, text in TEXTS.items():
+        data = f.load(text, {})
+        journal.replay(name, data)
+        table = db.table(name)
+        with db.lock:
+            with db.conn:
+                table.fill((), data)
+        # the replayed writes are in the database now
+        journal.checkpoint(name, journal.seq)
+        print("Imported {0} keys from {1} into {2}".format(len(data), text, name))
+    journal.close()
+    db.conn.close()
+
+
+if __name__ == "__main__":
+    import_texts()